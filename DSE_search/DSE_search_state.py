@@ -1,3 +1,5 @@
+import asyncio
+import copy
 import json
 import datetime
 import defs
@@ -27,6 +29,8 @@ from mock_sim import MockSim
 from gem5_sim import Gem5Sim
 from mcpat_sim import McPatSim
 from range_string import RangeString
+from simulation_wrapper import SimulationError
+from fitness_engine import LinearFitness, StatsTable, feasible_mask, score_batch, score_columns, stats_matrix
 
 def dict_to_key(d):
     """
@@ -34,6 +38,118 @@ def dict_to_key(d):
     """
     return tuple(sorted(d.items()))
 
+def run_sims(sims, sys_config, constraints = {}, known = {}):
+    """
+    Runs the simulation wrappers on sys_config as a pipeline of stages, from
+    the cheapest simulator (lowest SimWrap.cost) to the most expensive one.
+    Simulators with an entry in known are not rerun.  After each stage the
+    constraints on the stats available so far are checked, and the remaining
+    stages are skipped as soon as one is violated.
+
+    Returns a dictionary of simulation class name -> stats for the simulators
+    that were run.  Raises SimulationError if a simulator still fails after
+    its retries, with the stats of the simulators run so far attached.
+
+    NOTE: Kept at module level so it can be handed to worker processes
+    """
+    stats = {}
+    for sim in sorted(sims, key = lambda sim: sim.cost):
+        name = sim.__class__.__name__
+        if name in known:
+            sim_stats = known[name]
+        else:
+            try:
+                sim_stats = run_sim(sim, sys_config)
+            except SimulationError as error:
+                error.stats = stats
+                raise
+            stats[name] = sim_stats
+
+        if len(violated_constraints(constraints, {name: sim_stats})) > 0:
+            break
+
+    return stats
+
+async def run_sims_async(sims, sys_config, constraints, known, semaphore):
+    """
+    Same pipeline as run_sims(), but each simulator is awaited with
+    SimWrap.run_async() while holding the semaphore, which bounds the number
+    of simulations running at once.
+    """
+    stats = {}
+    for sim in sorted(sims, key = lambda sim: sim.cost):
+        name = sim.__class__.__name__
+        if name in known:
+            sim_stats = known[name]
+        else:
+            try:
+                async with semaphore:
+                    sim_stats = await run_sim_async(sim, sys_config)
+            except SimulationError as error:
+                error.stats = stats
+                raise
+            stats[name] = sim_stats
+
+        if len(violated_constraints(constraints, {name: sim_stats})) > 0:
+            break
+
+    return stats
+
+def run_sim(sim, sys_config):
+    """
+    Runs one simulator on sys_config, retrying up to sim.retries times, and
+    returns its stats
+    """
+    sim.set_config(sys_config)
+    for attempt in range(sim.retries + 1):
+        try:
+            sim.run()
+            # For each sys_config, each simulation_wrapper has a dictionary of stats.
+            return sim.search_stats()
+        except SimulationError as error:
+            logging.warning("Attempt {0} failed: {1}".format(attempt + 1, error))
+            failure = error
+
+    raise failure
+
+async def run_sim_async(sim, sys_config):
+    """
+    Same as run_sim(), but awaits SimWrap.run_async()
+    """
+    sim.set_config(sys_config)
+    for attempt in range(sim.retries + 1):
+        try:
+            await sim.run_async()
+            return sim.search_stats()
+        except SimulationError as error:
+            logging.warning("Attempt {0} failed: {1}".format(attempt + 1, error))
+            failure = error
+
+    raise failure
+
+def violated_constraints(constraints, stats):
+    """
+    Returns the constraints violated by a dictionary of simulation class name
+    -> stats.  Constraints on stats that are not available are not checked.
+    """
+    violated = []
+    for sim_stats in stats.values():
+        for stat in constraints.keys():
+            if stat in sim_stats and not constraints[stat].in_range(float(sim_stats[stat])):
+                violated.append(stat)
+
+    return violated
+
+def uses_stats(*names):
+    """
+    Declares the stats a fitness function reads, so simulators that produce
+    large stats (gem5) can drop all the others while parsing
+    """
+    def decorator(func):
+        func.required_stats = names
+        return func
+
+    return decorator
 
 class SearchState:
     """
@@ -47,8 +163,56 @@ class SearchState:
         eval_fitness()
             Applies fitness func to current sys_config and records the stats
             for the current sys_config in self.stats.
+        eval_fitness_batch()
+            Same as eval_fitness(), but for a list of sys_configs whose
+            simulations can be dispatched to a pool of worker processes.
+        eval_fitness_async()
+            Same as eval_fitness_batch(), but the simulations are awaited
+            concurrently from one asyncio event loop.
+        eval_fitness_columns()
+            Scores arrays of configs at once without recording them, when
+            every simulator is vectorized.
+        rescore()
+            Scores every recorded sys_config under another fitness function
+            in one vectorized pass.
+        submit(), collect()
+            Dispatch the simulations of sys_configs to a pool of worker
+            processes and record their results once they finish.
+        pareto_front()
+            Returns the recorded sys_configs that are Pareto optimal over
+            self.objectives.
+        set_options()
+            Switches the benchmark options (the fidelity) the simulations
+            run with.  Each options string keeps its own recorded stats.
         stats
             A dictionary of sys_config -> stats
+        sim_stats
+            A dictionary of simulator name -> projected sys_config -> stats,
+            see SimWrap.project_config()
+        pruned
+            A dictionary of sys_config -> violated constraints, failed and
+            skipped simulators, for sys_configs whose evaluation stopped early
+        violations
+            A dictionary of constraint name -> configs that violated it, for
+            the constraints with monotonicity hints (see RangeString).  Every
+            config they imply violates it too is pruned without simulating.
+        failures
+            A dictionary of simulator name -> projected sys_config -> reason,
+            for the runs that failed.  They are not retried, and every
+            sys_config sharing the projection is infeasible.
+        full_final_stats
+            If set, simulators only keep the stats required by the fitness
+            function and constraints during the search, and the final configs
+            are rerun to put all stats in the job output
+        result_store
+            Optional ResultStore consulted before running any simulator, so
+            results are shared across runs
+        simulations
+            The number of sys_configs whose simulators were run, which the
+            searcher's simulation budget is spent against
+        objectives
+            Stats minimized together by the multi-objective search, or None
+            for the stats read by the fitness function
         fitness
             The most recent fitness score
     """
@@ -60,38 +224,423 @@ class SearchState:
 
         self.constraints = {}
         for key in constraints.keys():
-            self.constraints[key] = RangeString(constraints[key])
+            if isinstance(constraints[key], RangeString):
+                self.constraints[key] = constraints[key]
+            else:
+                self.constraints[key] = RangeString(constraints[key])
+
+        self.benchmark = benchmark
+        self.options = options
+
+        # sys_config -> (future, stored stats) of simulations dispatched by
+        # submit()
+        self.pending = {}
+
+        # Optional persistent ResultStore shared across runs
+        self.result_store = None
+
+        # Simulator name -> projected sys_config -> stats.  Each simulator's
+        # results are cached under the parameters it depends on, so they are
+        # reused by every sys_config with the same projection.
+        self.sim_stats = {}
+
+        # sys_config -> why its evaluation stopped early (see record())
+        self.pruned = {}
 
-        pass
+        # Simulator name -> projected sys_config -> why it failed
+        self.failures = {}
+
+        # Constraint name -> [(above, sys_config)] of the recorded configs
+        # violating a constraint with monotonicity hints, past its upper end
+        # if above is set.  Only the configs no other one implies are kept.
+        self.violations = {}
+
+        # Keep only the stats the fitness function and constraints need during
+        # the search, and rerun the final configs for the job output
+        self.full_final_stats = False
+        self.full_stats = {}
+
+        # Columnar copy of the recorded stats for rescore()
+        self.stats_table = StatsTable()
+
+        # Number of sys_configs simulated (see finish())
+        self.simulations = 0
+
+        # Options -> recorded stats of the other fidelities (see set_options())
+        self.fidelities = {}
+
+        # Stats minimized by the multi-objective search, None for the
+        # features of the fitness function
+        self.objectives = None
 
     def eval_fitness(self, sys_config):
         """
         Runs the simulations and places the statistics in the stats dictionary
         """
+        # Don't run repeat simulations (just reuse results)
+        self.collect(sys_config)
+        if not dict_to_key(sys_config) in self.stats.keys():
+            self.prepare_sims()
+            stats = self.stored_stats(sys_config)
+            if self.needs_sims(sys_config, stats):
+                try:
+                    result = run_sims(self.sims, sys_config, self.constraints, stats)
+                except SimulationError as error:
+                    result = error
+                self.finish(sys_config, stats, result)
+            else:
+                self.record(sys_config, stats)
+
+        return self.score(sys_config)
+
+    def eval_fitness_batch(self, sys_configs, executor = None):
+        """
+        Evaluates a list of sys_configs and returns their fitnesses in the same
+        order.  If an executor (e.g. a ProcessPoolExecutor) is given, every
+        config without recorded stats is dispatched to it at once and the
+        results are collected into self.stats before scoring.
+        """
+        if executor is not None:
+            self.submit(sys_configs, executor)
+
+        return [self.eval_fitness(sys_config) for sys_config in sys_configs]
+
+    async def eval_fitness_async(self, sys_configs, max_concurrent = 8):
+        """
+        Evaluates a list of sys_configs from one asyncio event loop, with up to
+        max_concurrent simulations running at once, and returns their
+        fitnesses in the same order.  i.e.
+            asyncio.run(search_state.eval_fitness_async(sys_configs, 32))
+        """
+        self.prepare_sims()
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        tasks = {}
+        for sys_config in sys_configs:
+            key = dict_to_key(sys_config)
+            self.collect(sys_config)
+            if key in self.stats.keys() or key in tasks.keys():
+                continue
+
+            stats = self.stored_stats(sys_config)
+            if not self.needs_sims(sys_config, stats):
+                self.record(sys_config, stats)
+                continue
+
+            # Every run gets its own copies of the simulators, since they
+            # hold the config being simulated
+            tasks[key] = (sys_config, stats, asyncio.ensure_future(
+                    run_sims_async(copy.deepcopy(self.sims), sys_config,
+                                   self.constraints, stats, semaphore)))
+
+        for (sys_config, stats, task) in tasks.values():
+            try:
+                result = await task
+            except SimulationError as error:
+                result = error
+            self.finish(sys_config, stats, result)
+
+        return [self.eval_fitness(sys_config) for sys_config in sys_configs]
+
+    def submit(self, sys_configs, executor):
+        """
+        Dispatches the simulations of each sys_config to the executor, unless
+        its stats are already recorded or its simulations are already in
+        flight.  Returns the futures the given sys_configs are waiting on.
+        """
+        self.prepare_sims()
+
+        futures = []
+        for sys_config in sys_configs:
+            key = dict_to_key(sys_config)
+            if key in self.stats.keys():
+                continue
+
+            if not key in self.pending.keys():
+                stats = self.stored_stats(sys_config)
+                if not self.needs_sims(sys_config, stats):
+                    self.record(sys_config, stats)
+                    continue
+                self.pending[key] = (executor.submit(run_sims, self.sims, sys_config,
+                                                     self.constraints, stats), stats)
+            futures.append(self.pending[key][0])
+
+        return futures
+
+    def collect(self, sys_config):
+        """
+        Records the stats of sys_config if its simulations were dispatched by
+        submit(), waiting for them to finish if needed
+        """
+        key = dict_to_key(sys_config)
+        if key in self.pending.keys():
+            (future, stats) = self.pending.pop(key)
+            try:
+                result = future.result()
+            except SimulationError as error:
+                result = error
+            self.finish(sys_config, stats, result)
+
+    def finish(self, sys_config, stats, result):
+        """
+        Records the outcome of running the simulations of sys_config on top of
+        the known stats: either the new stats, or the SimulationError of the
+        simulator that failed along with the stats of those run before it
+        """
+        self.simulations += 1
+
+        if isinstance(result, SimulationError):
+            logging.warning("Giving up on {0}: {1}".format(sys_config, result))
+            for sim in self.sims:
+                if sim.__class__.__name__ == result.sim_name:
+                    config = sim.project_config(sys_config)
+                    self.failures.setdefault(result.sim_name, {})[dict_to_key(config)] = result.reason
+            result = result.stats
+
+        self.store_stats(sys_config, result)
+        stats.update(result)
+        self.record(sys_config, stats)
+
+    def set_options(self, options):
+        """
+        Switches the benchmark options (e.g. the input size) the simulations
+        run with.  Results depend on the options, so every options string
+        keeps its own recorded stats, pruned configs, violations and failures, and
+        switching back to an earlier one restores them.  Only the caches of
+        simulators that take the options (Gem5Sim) are separated; the results
+        of the others are shared by every fidelity.
+        """
+        if options == self.options:
+            return
+
+        if len(self.pending) > 0:
+            raise ValueError("Can't switch options while simulations are in flight.")
+
+        dependent = [sim.__class__.__name__ for sim in self.sims if hasattr(sim, "options")]
+        self.fidelities[self.options] = (
+                self.stats, self.pruned, self.full_stats, self.stats_table, self.violations,
+                dict((name, self.sim_stats.pop(name)) for name in dependent if name in self.sim_stats),
+                dict((name, self.failures.pop(name)) for name in dependent if name in self.failures))
+
+        (self.stats, self.pruned, self.full_stats, self.stats_table, self.violations, sim_stats, failures) = \
+                self.fidelities.pop(options, ({}, {}, {}, StatsTable(), {}, {}, {}))
+        self.sim_stats.update(sim_stats)
+        self.failures.update(failures)
+
+        self.options = options
+        for sim in self.sims:
+            if hasattr(sim, "options"):
+                sim.options = options
+
+    def precompute(self, param_ranges, max_workers = 1):
+        """
+        Lets the simulators that support it compute their results for the
+        whole search space before the search starts (see SimWrap.precompute())
+        """
+        for sim in self.sims:
+            sim.precompute(param_ranges, max_workers)
+
+    def required_stats(self):
+        """
+        Returns the names of the stats read by the fitness function and the
+        constraints, or None if the fitness function doesn't declare them
+        (see uses_stats())
+        """
+        names = getattr(self.fitness_func, "required_stats", None)
+        if names is None:
+            return None
+
+        return set(names) | set(self.constraints.keys())
+
+    def prepare_sims(self):
+        """
+        Tells the simulators which stats to keep, and the bounds at which
+        they can stop a run early
+        """
+        required = self.required_stats()
+        for sim in self.sims:
+            if sim.filters_stats:
+                sim.stat_filter = required
+            if sim.monotonic_stats:
+                sim.stat_bounds = dict((name, self.constraints[name]) for name in sim.monotonic_stats
+                                       if name in self.constraints and
+                                       self.constraints[name].high != float("inf"))
+
+    def final_stats(self, sys_config):
+        """
+        Returns the stats of sys_config for the job output.  With
+        self.full_final_stats set, the simulators that only kept the required
+        stats during the search are rerun to get all of their stats.
+        """
+        key = dict_to_key(sys_config)
+        stats = self.stats[key]
+        if not self.full_final_stats or key in self.pruned.keys():
+            return stats
+
+        if not key in self.full_stats.keys():
+            filtered = [sim for sim in self.sims if sim.filters_stats and sim.stat_filter is not None]
+            for sim in filtered:
+                sim.stat_filter = None
+            known = dict((name, stats[name]) for name in stats.keys()
+                         if not name in [sim.__class__.__name__ for sim in filtered])
+
+            self.full_stats[key] = dict(known)
+            try:
+                self.full_stats[key].update(run_sims(self.sims, sys_config, known = known))
+            except SimulationError as error:
+                logging.warning("Keeping the filtered stats of {0}: {1}".format(sys_config, error))
+                self.full_stats[key] = stats
+
+        return self.full_stats[key]
+
+    def stored_stats(self, sys_config):
+        """
+        Returns the stats of each simulator that are already known for the
+        projection of sys_config, from memory or from the result store
+        """
+        stats = {}
+        for sim in self.sims:
+            name = sim.__class__.__name__
+            config = sim.project_config(sys_config)
+            cache = self.sim_stats.setdefault(name, {})
+
+            if (not dict_to_key(config) in cache.keys() and self.result_store is not None):
+                sim_stats = self.result_store.get(sim, config, self.benchmark, self.options)
+                if sim_stats is not None:
+                    cache[dict_to_key(config)] = sim_stats
+
+            if dict_to_key(config) in cache.keys():
+                stats[name] = cache[dict_to_key(config)]
+
+        return stats
+
+    def store_stats(self, sys_config, stats):
+        """
+        Caches freshly simulated stats under each simulator's projection of
+        sys_config, and saves them to the result store
+        """
+        for sim in self.sims:
+            name = sim.__class__.__name__
+            if name in stats:
+                config = sim.project_config(sys_config)
+                self.sim_stats.setdefault(name, {})[dict_to_key(config)] = stats[name]
+                if self.result_store is not None:
+                    self.result_store.put(sim, config, self.benchmark, self.options, stats[name])
+
+    def missing_sims(self, stats):
+        """
+        Returns the simulators without an entry in stats
+        """
+        return [sim for sim in self.sims if not sim.__class__.__name__ in stats]
+
+    def known_failures(self, sys_config):
+        """
+        Returns simulator name -> reason for the simulators that already
+        failed on their projection of sys_config
+        """
+        failed = {}
+        for sim in self.sims:
+            name = sim.__class__.__name__
+            config = dict_to_key(sim.project_config(sys_config))
+            if config in self.failures.get(name, {}).keys():
+                failed[name] = self.failures[name][config]
+
+        return failed
+
+    def needs_sims(self, sys_config, stats):
+        """
+        Determines whether any simulator still has to run, given the stats
+        already known for sys_config
+        """
+        return (len(self.missing_sims(stats)) > 0 and
+                len(violated_constraints(self.constraints, stats)) == 0 and
+                len(self.known_failures(sys_config)) == 0 and
+                len(self.implied_violations(sys_config)) == 0)
+
+    def implied_violations(self, sys_config):
+        """
+        Returns the constraints that sys_config is known to violate without
+        simulating it: by their monotonicity hints, it is at least as far out
+        of range as a config that violated them
+        """
+        implied = []
+        for (name, violations) in self.violations.items():
+            if any(self.constraints[name].implies_violation(config, sys_config, above)
+                   for (above, config) in violations):
+                implied.append(name)
+
+        return implied
+
+    def add_violations(self, sys_config, stats):
+        """
+        Adds sys_config to self.violations for each constraint with
+        monotonicity hints its stats violate
+        """
+        for name in violated_constraints(self.constraints, stats):
+            constraint = self.constraints[name]
+            if len(constraint.monotonic) == 0:
+                continue
+
+            value = [sim_stats[name] for sim_stats in stats.values() if name in sim_stats][0]
+            above = constraint.above(float(value))
+            violations = self.violations.setdefault(name, [])
+            if any(a == above and constraint.implies_violation(config, sys_config, above)
+                   for (a, config) in violations):
+                continue
+
+            violations[:] = [(a, config) for (a, config) in violations
+                             if a != above or not constraint.implies_violation(sys_config, config, above)]
+            violations.append((above, sys_config))
+
+    def record(self, sys_config, stats):
+        """
+        Records the stats of sys_config.  If a constraint was violated or a
+        simulator failed before every simulator ran, the skipped simulators,
+        the violated constraints and the failures are recorded in self.pruned,
+        along with the violations implied by the monotonicity hints.
+        """
+        self.stats[dict_to_key(sys_config)] = stats
+        self.add_violations(sys_config, stats)
+
+        skipped = [sim.__class__.__name__ for sim in self.missing_sims(stats)]
+        if len(skipped) > 0:
+            violated = violated_constraints(self.constraints, stats)
+            self.pruned[dict_to_key(sys_config)] = {
+                    "violated_constraints": violated,
+                    "skipped_simulations": skipped }
+
+            failed = self.known_failures(sys_config)
+            if len(failed) > 0:
+                self.pruned[dict_to_key(sys_config)]["failed_simulations"] = failed
+
+            implied = [name for name in self.implied_violations(sys_config) if not name in violated]
+            if len(implied) > 0:
+                self.pruned[dict_to_key(sys_config)]["implied_violations"] = implied
+
+    def score(self, sys_config):
+        """
+        Applies the constraints and the fitness function to the recorded stats
+        of sys_config
+        """
         # Replace the old system configuration
         self.sys_config = sys_config
 
         # Reset fitness value
         self.fitness = 0
-        # Don't run repeat simulations (just reuse results)
-        if not dict_to_key(sys_config) in self.stats.keys():
-            # initialize sub dictionary if it doesn't already
-            # exist
-            self.stats[dict_to_key(sys_config)] = {}
-            for sim in self.sims:
-                sim.set_config(self.sys_config)
-                sim.run()
-                # For each sys_config, each simulation_wrapper has a dictionary of stats.
-                self.stats[dict_to_key(sys_config)][sim.__class__.__name__] = sim.stats
 
+        if dict_to_key(sys_config) in self.pruned.keys():
+            self.fitness = float("inf")
+            return self.fitness
+
+        config_stats = self.stats[dict_to_key(sys_config)]
         for sim in self.sims:
             # We need to search the stats of the current simulation
             # runs for constraint violations
-            sim_stats = self.stats[dict_to_key(sys_config)][sim.__class__.__name__]
+            sim_stats = config_stats[sim.__class__.__name__]
             for stat in self.constraints.keys():
                 # TODO: need translation from abstract constraint name -> simulator stat name
                 if stat in sim_stats:
-                    stat_value = sim_stats[stat]
+                    stat_value = float(sim_stats[stat])
                     if (not self.constraints[stat].in_range(stat_value)):
                         self.fitness = float("inf")
                 else:
@@ -100,37 +649,179 @@ class SearchState:
         if self.fitness != float("inf"):
             all_stats = {}
             for sim in self.sims:
-                all_stats.update(sim.stats)
+                all_stats.update(config_stats[sim.__class__.__name__])
             self.fitness = self.fitness_func(all_stats)
 
         return self.fitness
 
+    def merged_stats(self, sys_config):
+        """
+        Returns the recorded stats of every simulator that ran on sys_config,
+        merged into one dictionary
+        """
+        stats = self.stats[dict_to_key(sys_config)]
+        merged = {}
+        for sim in self.sims:
+            merged.update(stats.get(sim.__class__.__name__, {}))
+
+        return merged
+
+    def vectorized(self):
+        """
+        Determines whether eval_fitness_columns() can be used, i.e. every
+        simulator computes its stats in batches
+        """
+        return all(sim.vectorized for sim in self.sims)
+
+    def eval_fitness_columns(self, columns):
+        """
+        Evaluates many configs at once, given as a dictionary of config
+        parameter -> NumPy array with one entry per config, and returns a
+        NumPy array of their fitnesses.  Meant for sweeps over millions of
+        configs with vectorized simulators (MockSim), so the stats are not
+        recorded.
+        """
+        if not self.vectorized():
+            raise ValueError("Not all simulators can compute stats in batches.")
+
+        stats = {}
+        for sim in self.sims:
+            stats.update(sim.batch_stats(columns))
+
+        return score_columns(self.fitness_func, self.constraints, stats)
+
+    def rescore(self, fitness_func = None):
+        """
+        Scores every recorded sys_config at once under fitness_func (e.g.
+        another fitness profile), or self.fitness_func, and the constraints,
+        without running any simulation.  Returns a dictionary of sys_config ->
+        fitness.
+        """
+        if fitness_func is None:
+            fitness_func = self.fitness_func
+
+        for key in self.stats.keys():
+            if not key in self.pruned.keys() and not key in self.stats_table.index:
+                all_stats = {}
+                for sim in self.sims:
+                    all_stats.update(self.stats[key][sim.__class__.__name__])
+                self.stats_table.add(key, all_stats)
+
+        fitnesses = dict((key, float("inf")) for key in self.pruned.keys() if key in self.stats.keys())
+        if len(self.stats_table) > 0:
+            scores = score_batch(fitness_func, self.constraints, self.stats_table)
+            fitnesses.update(zip(self.stats_table.keys, scores.tolist()))
+
+        return fitnesses
+
+    def objective_names(self):
+        """
+        Returns the stats minimized by the multi-objective search
+        """
+        if self.objectives is not None:
+            return list(self.objectives)
+
+        names = getattr(self.fitness_func, "features", getattr(self.fitness_func, "required_stats", None))
+        if names is None:
+            raise ValueError("The fitness function doesn't declare its stats, please set the objectives.")
+
+        return list(names)
+
+    def objective_matrix(self, sys_configs):
+        """
+        Returns a NumPy array of the objectives of recorded sys_configs, one
+        row per sys_config.  Every objective of an infeasible sys_config
+        (pruned, or violating a constraint) is inf, as are missing stats.
+        """
+        import numpy as np
+
+        rows = [self.merged_stats(sys_config) for sys_config in sys_configs]
+        F = stats_matrix(rows, self.objective_names())
+        F[np.isnan(F)] = float("inf")
+
+        pruned = np.array([dict_to_key(sys_config) in self.pruned.keys() for sys_config in sys_configs],
+                          dtype = bool)
+        F[pruned | ~feasible_mask(self.constraints, rows)] = float("inf")
+        return F
+
+    def pareto_front(self, sys_configs = None):
+        """
+        Returns the feasible sys_configs that no other one beats in every
+        objective, out of sys_configs or every recorded sys_config.  One
+        front serves every fitness profile weighing the same stats: the
+        best config of each profile is on it.
+        """
+        from pareto import pareto_mask
+        import numpy as np
+
+        if sys_configs is None:
+            sys_configs = [dict(key) for key in self.stats.keys()]
+
+        if len(sys_configs) == 0:
+            return []
+
+        F = self.objective_matrix(sys_configs)
+        feasible = np.all(np.isfinite(F), axis = 1)
+        mask = np.zeros(len(sys_configs), dtype = bool)
+        mask[feasible] = pareto_mask(F[feasible])
+
+        return [sys_config for (sys_config, on_front) in zip(sys_configs, mask) if on_front]
+
     def stats_to_json(self, sys_config):
         """
         Outputs the stats of the simulation with the simulation class name as
         the top level key
         """
-        return json.dumps(self.stats[dict_to_key(sys_config)], sort_keys=True, indent=4)
+        return json.dumps(self.output_stats(self.stats[dict_to_key(sys_config)]), sort_keys=True, indent=4)
+
+    def output_stats(self, stats):
+        """
+        Converts recorded stats (simulator name -> stats) into the form each
+        simulator gives them in the job output (see SimWrap.output_stats())
+        """
+        output = dict(stats)
+        for sim in self.sims:
+            name = sim.__class__.__name__
+            if name in output:
+                output[name] = sim.output_stats(output[name])
 
+        return output
 
-    def generate_job_output(self, sys_configs):
+
+    def generate_job_output(self, sys_configs, pareto_front = None):
+        """
+        Outputs the constraints and the stats of sys_configs, one search party
+        each.  A list of sys_configs passed as pareto_front (see
+        pareto_front()) is output the same way, along with its objectives.
+        """
         job_output = {}
 
         job_output["job_name"] = "Mock Test"
         job_output["job_timestamp"] = "{:%Y-%m-%d %H:%M:%S}".format(datetime.datetime.now())
-        job_output["constraints"] = self.constraints
+        job_output["constraints"] = dict((key, str(self.constraints[key])) for key in self.constraints.keys())
         job_output["search_parties"] = []
         for sys_config in sys_configs:
             search_party = {}
             search_party["system_configuration"] = sys_config
-            search_party["simulation_results"] = self.stats[dict_to_key(sys_config)]
+            search_party["simulation_results"] = self.output_stats(self.final_stats(sys_config))
+            if dict_to_key(sys_config) in self.pruned.keys():
+                search_party["pruned"] = self.pruned[dict_to_key(sys_config)]
             job_output["search_parties"].append(search_party)
 
+        if pareto_front is not None:
+            job_output["objectives"] = self.objective_names()
+            job_output["pareto_front"] = []
+            for sys_config in pareto_front:
+                job_output["pareto_front"].append({
+                        "system_configuration": sys_config,
+                        "simulation_results": self.output_stats(self.final_stats(sys_config)) })
+
         return json.dumps(job_output, sort_keys=True, indent=4)
 
 """
 Default MockSim class
 """
+@uses_stats("execution time (s)", "Area (mm2)")
 def mock_eval_stats(stats):
     """
     Basic function to minimize for the Mock Simulator
@@ -179,17 +870,10 @@ class MockSearchState(SearchState):
 Embedded MockSim Class
 """
 
-def eval_embedded(stats):
-    m = [4.7721E6, 1.7763E3, 1.7763E3, 1.0427E-10]
-    s = [1.0044E7, 1.2847E3, 1.2847E3, 1.2395E-10]
-    w = [2, 1, 1, 10]
-
-    result = ((stats["Area (mm2)"] - m[0]) / s[0] * w[0]) \
-           + ((stats["Dynamic read energy (nJ)"] - m[1]) / s[1] * w[1]) \
-           + ((stats["Dynamic write energy (nJ)"] - m[2]) / s[2] * w[2]) \
-           + ((stats["execution time (s)"] - m[3]) / s[3] * w[3])
-
-    return result
+eval_embedded = LinearFitness(["Area (mm2)", "Dynamic read energy (nJ)", "Dynamic write energy (nJ)", "execution time (s)"],
+                              m = [4.7721E6, 1.7763E3, 1.7763E3, 1.0427E-10],
+                              s = [1.0044E7, 1.2847E3, 1.2847E3, 1.2395E-10],
+                              w = [2, 1, 1, 10])
 
 class EmbeddedSearchState(MockSearchState):
     """
@@ -205,17 +889,10 @@ class EmbeddedSearchState(MockSearchState):
 Balanced MockSim Class
 """
 
-def eval_balanced(stats):
-    m = [4.7721E6, 1.7763E3, 1.7763E3, 1.0427E-10]
-    s = [1.0044E7, 1.2847E3, 1.2847E3, 1.2395E-10]
-    w = [1, 1, 1, 1]
-
-    result = ((stats["Area (mm2)"] - m[0]) / s[0] * w[0]) \
-           + ((stats["Dynamic read energy (nJ)"] - m[1]) / s[1] * w[1]) \
-           + ((stats["Dynamic write energy (nJ)"] - m[2]) / s[2] * w[2]) \
-           + ((stats["execution time (s)"] - m[3]) / s[3] * w[3])
-
-    return result
+eval_balanced = LinearFitness(["Area (mm2)", "Dynamic read energy (nJ)", "Dynamic write energy (nJ)", "execution time (s)"],
+                              m = [4.7721E6, 1.7763E3, 1.7763E3, 1.0427E-10],
+                              s = [1.0044E7, 1.2847E3, 1.2847E3, 1.2395E-10],
+                              w = [1, 1, 1, 1])
 
 
 class BalancedSearchState(MockSearchState):
@@ -230,17 +907,10 @@ class BalancedSearchState(MockSearchState):
 """
 High performance MockSim Class
 """
-def eval_high_performance(stats):
-    m = [4.7721E6, 1.7763E3, 1.7763E3, 1.0427E-10]
-    s = [1.0044E7, 1.2847E3, 1.2847E3, 1.2395E-10]
-    w = [10, 10, 10, 1]
-
-    result = ((stats["Area (mm2)"] - m[0]) / s[0] * w[0]) \
-           + ((stats["Dynamic read energy (nJ)"] - m[1]) / s[1] * w[1]) \
-           + ((stats["Dynamic write energy (nJ)"] - m[2]) / s[2] * w[2]) \
-           + ((stats["execution time (s)"] - m[3]) / s[3] * w[3])
-
-    return result
+eval_high_performance = LinearFitness(["Area (mm2)", "Dynamic read energy (nJ)", "Dynamic write energy (nJ)", "execution time (s)"],
+                                      m = [4.7721E6, 1.7763E3, 1.7763E3, 1.0427E-10],
+                                      s = [1.0044E7, 1.2847E3, 1.2847E3, 1.2395E-10],
+                                      w = [10, 10, 10, 1])
 
 class HighPerformanceSearchState(MockSearchState):
     """
@@ -251,31 +921,15 @@ class HighPerformanceSearchState(MockSearchState):
     def __init__(self, constraints, sys_config, benchmark, options):
         super().__init__(constraints, sys_config, benchmark, options, eval_high_performance)
 
-def eval_temp(stats):
-    features = ["sim_seconds", "Area (mm2)", "Dynamic read energy (nJ)"]
-    m = [7.2927E-04, 0.0702, 0.0308]
-    s = [6.7216e-05, 0.0323, 0.001]
-    w = [50, 5, 1]
-
-    result = 0
-
-    for i in range(len(features)):
-        result += ((float(stats[features[i]]) - m[i]) / s[i]) * w[i]
-
-    return result
-
-def eval_demo(stats):
-    features = ["sim_seconds", "Area (mm2)", "Dynamic read energy (nJ)"]
-    m = [2.1969E-04, 0.0861, 0.0312]
-    s = [9.7346E-06, 0.0318, 8.1234e-04]
-    w = [50, 5, 1]
-
-    result = 0
+eval_temp = LinearFitness(["sim_seconds", "Area (mm2)", "Dynamic read energy (nJ)"],
+                          m = [7.2927E-04, 0.0702, 0.0308],
+                          s = [6.7216e-05, 0.0323, 0.001],
+                          w = [50, 5, 1])
 
-    for i in range(len(features)):
-        result += ((float(stats[features[i]]) - m[i]) / s[i]) * w[i]
-
-    return result
+eval_demo = LinearFitness(["sim_seconds", "Area (mm2)", "Dynamic read energy (nJ)"],
+                          m = [2.1969E-04, 0.0861, 0.0312],
+                          s = [9.7346E-06, 0.0318, 8.1234e-04],
+                          w = [50, 5, 1])
 
 
 """
@@ -294,6 +948,7 @@ class FullSearchState(SearchState):
 """
 Default McPAT class
 """
+@uses_stats("Area (mm2)", "Dynamic read energy (nJ)", "Dynamic write energy (nJ)")
 def mcpat_eval_stats(stats):
     """
     Basic function to minimize for the McPAT simulator
@@ -302,9 +957,9 @@ def mcpat_eval_stats(stats):
     a = 1
     b = 1
     c = 1
-    result = a*float(stats["Area (mm2)"]) + \
-             b*float(stats["Dynamic read energy (nJ)"]) + \
-             c*float(stats["Dynamic write energy (nJ)"])
+    result = a*stats["Area (mm2)"] + \
+             b*stats["Dynamic read energy (nJ)"] + \
+             c*stats["Dynamic write energy (nJ)"]
 
     return result
 
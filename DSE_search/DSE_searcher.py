@@ -10,41 +10,36 @@
 #
 
 import logging
+import math
 import itertools as it
 import random as r
 import copy
+import heapq
 import os
+import time
 
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from enum import Enum
 
 from mock_sim import MockSim
 
-class hashabledict(dict):
-    def __hash__(self):
-        return hash(tuple(sorted(self.items())))
-
 class Search_Algorithm(Enum):
     Elitist_Hill_Climber = 1
     Stochastic_Hill_Climber = 2
     A_Star = 3
-
-def param_has_next(val, param_range):
-    if (not val in param_range):
-        raise ValueError("Current value not in range.")
-
-    return param_range.index(val) < (len(param_range) - 1)
-
-def param_next(val, param_range):
-    return param_range[param_range.index(val) + 1]
-
-def param_has_prev(val, param_range):
-    if (not val in param_range):
-        raise ValueError("Current value not in range.")
-
-    return param_range.index(val) > 0
-
-def param_prev(val, param_range):
-    return param_range[param_range.index(val) - 1]
+    Exhaustive = 4
+    Bayesian = 5
+    Successive_Halving = 6
+    Hyperband = 7
+    NSGA_II = 8
+    Simulated_Annealing = 9
+    Tabu = 10
+    Genetic = 11
+
+class Seeding(Enum):
+    Repel = 1
+    Latin_Hypercube = 2
 
 def seed_dist(A, B):
     """
@@ -81,6 +76,39 @@ def seed_repel(A, B, ranges, alpha, min_dist):
                 if (A[key] < (len(ranges[key]) - 1)):
                     A[key] += 1
 
+def latin_hypercube_seeds(sizes, N, min_dist, attempts = 1000):
+    """
+    Draws N index tuples over parameter ranges of the given sizes by Latin
+    hypercube sampling: each range is cut into N strata and every stratum is
+    used by exactly one seed.  Seeds closer than min_dist (L1) to an earlier
+    seed are redrawn uniformly, up to attempts times, so the returned seeds
+    are always at least min_dist apart.
+    """
+    strata = [list(range(N)) for _ in sizes]
+    for s in strata:
+        r.shuffle(s)
+
+    seeds = []
+    for i in range(N):
+        seed = tuple(int((strata[d][i] + r.random()) * sizes[d] / N) for d in range(len(sizes)))
+
+        tries = 0
+        while (any(index_dist(seed, other) < min_dist for other in seeds)):
+            if (tries == attempts):
+                raise ValueError("Could not place {0} seeds at least {1} apart.".format(N, min_dist))
+            seed = tuple(r.randrange(size) for size in sizes)
+            tries += 1
+
+        seeds.append(seed)
+
+    return seeds
+
+def index_dist(A, B):
+    """
+    Calculates the L1 distance between two index tuples
+    """
+    return sum(abs(a - b) for (a, b) in zip(A, B))
+
 
 default_param_ranges = {
                        "cpu_count" : list(range(1, 9)),
@@ -95,11 +123,25 @@ class DSE_searcher:
     Uses the simulation wrappers to a run a variety of simulations
     """
 
-    def __init__(self, param_ranges, max_iterations = 20, num_search_parties = 1):
+    def __init__(self, param_ranges, max_iterations = 20, num_search_parties = 1,
+                 num_workers = 1, concurrent_parties = False,
+                 seeding = Seeding.Repel, min_seed_dist = 2):
         """
         public functions:
         - search()
             Finds a locally optimal system configuration
+
+        num_workers > 1 evaluates the neighbors of each search step in
+        parallel on a pool of that many worker processes.
+
+        concurrent_parties lets every search party of the hill climber advance
+        on its own instead of in lock step.  Unless num_workers says otherwise,
+        the pool gets one worker per search party.
+
+        seeding picks how the search parties are placed.  Seeding.Repel runs
+        10000 * num_search_parties random repulsion steps, while
+        Seeding.Latin_Hypercube costs O(num_search_parties) draws and
+        guarantees the seeds are at least min_seed_dist (L1) apart.
         """
 
         if (max_iterations < 1):
@@ -108,18 +150,67 @@ class DSE_searcher:
         if (num_search_parties < 1):
             raise ValueError("Number of search parties must be strictly positive.")
 
+        if (num_workers < 1):
+            raise ValueError("Number of workers must be strictly positive.")
+
         if (not isinstance(param_ranges, dict)):
             raise ValueError("Parameter ranges takes the form of a dictionary.")
 
         self.max_iterations = max_iterations
         self.num_search_parties = num_search_parties
+        self.num_workers = num_workers
+        self.concurrent_parties = concurrent_parties
+        self.seeding = seeding
+        self.min_seed_dist = min_seed_dist
+        # Worker pool, only alive for the duration of search()
+        self.executor = None
 
         # Default to elitism policy - best of N search directions is chosen
         self.algorithm = Search_Algorithm.Elitist_Hill_Climber
         # Default to searching all dimensions to determine best gradient.
-        # (-1 denotes all directions. Range: {-1} ^ [1, D]
-        # TODO: implment this feature (Eric Rock)
+        # (-1 denotes all directions. Range: {-1} ^ [1, D]).  Otherwise each
+        # hill climbing step only evaluates the neighbors along that many
+        # random dimensions.
         self.search_directions = -1
+        # Simulated annealing: starting temperature, in fitness units, and
+        # the factor it is multiplied by after every step
+        self.initial_temperature = 1.0
+        self.cooling_rate = 0.95
+        # Tabu search: number of recent configs each party won't go back to,
+        # and of worsening steps without improvement after which it stops
+        self.tabu_tenure = 8
+        # Hard budget of the hill climbers and simulated annealing, on top of
+        # max_iterations: the number of sys_configs simulated and the
+        # seconds spent by one search() (None for no limit).  The hill
+        # climbers check it before each party's step, and the other searches
+        # before each round of all parties, so a step in progress is always
+        # finished.
+        self.max_simulations = None
+        self.time_limit = None
+        # Let simulators with a lookup table mode (McPatSim) fill it for the
+        # whole parameter range, num_workers runs at a time, before searching
+        self.precompute = False
+        # Number of configs evaluated at once by the exhaustive sweep
+        self.chunk_size = 2**16
+        # Bayesian optimization: number of configs simulated before the
+        # surrogate models are first fitted (None for one more than the number
+        # of parameters), and the most unsimulated configs scored by the
+        # acquisition function each round
+        self.initial_samples = None
+        self.candidate_limit = 2**14
+        # Successive halving / Hyperband: benchmark options from the cheapest
+        # to the most accurate (e.g. input sizes ["10", "100", "1000"]; None
+        # for the search state's own options only), and the fraction
+        # 1 / halving_rate of the configs promoted to the next options
+        self.fidelities = None
+        self.halving_rate = 3
+        # Population searches (NSGA-II, genetic): configs per generation,
+        # and the probability of mutating each parameter of an offspring
+        # (None for one over the number of parameters)
+        self.population_size = 32
+        self.mutation_rate = None
+        # Configs on the Pareto front found by the multi-objective search
+        self.pareto_front = []
 
         self.sys_configs = []
         self.fitness_vals = []
@@ -129,6 +220,14 @@ class DSE_searcher:
         for key in param_ranges.keys():
             self.param_ranges[key] = param_ranges[key]
 
+        # Configs can be encoded as a tuple of indices into the parameter
+        # ranges, in the order of self.param_keys
+        self.param_keys = list(self.param_ranges.keys())
+        self.param_indices = {}
+        for key in self.param_keys:
+            self.param_indices[key] = dict((val, i) for (i, val) in enumerate(self.param_ranges[key]))
+        self.param_sizes = tuple(len(self.param_ranges[key]) for key in self.param_keys)
+
         self.sys_configs = self.gen_search_parties(self.num_search_parties);
 
         for _ in self.sys_configs:
@@ -139,11 +238,19 @@ class DSE_searcher:
         Generates a list of system configurations which are some (configurable)
         distance from each other.
         """
+        if (self.seeding == Seeding.Latin_Hypercube):
+            seeds = latin_hypercube_seeds(self.param_sizes, N, self.min_seed_dist)
+            configs = [self.index_to_config(seed) for seed in seeds]
+            for i in range(0, N):
+                logging.info("initial config{0}: {1}".format(i, configs[i]))
+
+            return configs
+
         # Repelling rate
         alpha = 0.5
 
         # Minimum distance within which repelling will occur
-        min_dist = 2
+        min_dist = self.min_seed_dist
 
         # num iterations
         iterations = 10000 * N
@@ -182,11 +289,59 @@ class DSE_searcher:
         Directs search according to chosen search algorithm.
         """
 
-        if ((self.algorithm == Search_Algorithm.Elitist_Hill_Climber) or
-            (self.algorithm == Search_Algorithm.Stochastic_Hill_Climber)):
-            self.search_hill_climber(search_state)
-        elif (self.algorithm == Search_Algorithm.A_Star):
-            self.search_a_star(search_state)
+        if (self.precompute):
+            search_state.precompute(self.param_ranges, self.num_workers)
+
+        self.start_time = time.monotonic()
+        self.start_simulations = search_state.simulations
+
+        if (self.num_workers > 1):
+            self.executor = ProcessPoolExecutor(max_workers = self.num_workers)
+        elif (self.concurrent_parties):
+            self.executor = ProcessPoolExecutor(max_workers = self.num_search_parties)
+
+        try:
+            if ((self.algorithm == Search_Algorithm.Elitist_Hill_Climber) or
+                (self.algorithm == Search_Algorithm.Stochastic_Hill_Climber)):
+                if (self.concurrent_parties):
+                    self.search_hill_climber_concurrent(search_state)
+                else:
+                    self.search_hill_climber(search_state)
+            elif (self.algorithm == Search_Algorithm.A_Star):
+                self.search_a_star(search_state)
+            elif (self.algorithm == Search_Algorithm.Exhaustive):
+                self.search_exhaustive(search_state)
+            elif (self.algorithm == Search_Algorithm.Bayesian):
+                self.search_bayesian(search_state)
+            elif (self.algorithm == Search_Algorithm.Successive_Halving):
+                self.search_successive_halving(search_state)
+            elif (self.algorithm == Search_Algorithm.Hyperband):
+                self.search_hyperband(search_state)
+            elif (self.algorithm == Search_Algorithm.NSGA_II):
+                self.search_nsga2(search_state)
+            elif (self.algorithm == Search_Algorithm.Simulated_Annealing):
+                self.search_annealing(search_state)
+            elif (self.algorithm == Search_Algorithm.Tabu):
+                self.search_tabu(search_state)
+            elif (self.algorithm == Search_Algorithm.Genetic):
+                self.search_genetic(search_state)
+        finally:
+            if (self.executor is not None):
+                self.executor.shutdown()
+                self.executor = None
+
+    def eval_configs(self, sys_configs, search_state):
+        """
+        Evaluates a list of configs, using the worker pool if there is one
+        """
+        return search_state.eval_fitness_batch(sys_configs, self.executor)
+
+    def eval_indices(self, indices, search_state):
+        """
+        Evaluates a list of index tuples.  They are only decoded into configs
+        here, at the boundary to the search state.
+        """
+        return self.eval_configs([self.index_to_config(index) for index in indices], search_state)
 
 
     def search_hill_climber(self, search_state):
@@ -194,12 +349,13 @@ class DSE_searcher:
         Implements a hill climbing search algorithm given the starting seed
         configurations.
         """
-        # TODO store direction we came from to cut down on superfluous searches
-
         # Initialize fitness scores for each configuration
-        for i in range(self.num_search_parties):
-            self.fitness_vals[i] = search_state.eval_fitness(self.sys_configs[i])
+        self.fitness_vals = self.eval_configs(self.sys_configs, search_state)
 
+        # The parties climb in index space.  The config a party came from was
+        # worse than where it is, so it isn't evaluated again.
+        positions = [self.config_to_index(c) for c in self.sys_configs]
+        previous = [None] * self.num_search_parties
         converged = []
 
         for i in range(self.max_iterations):
@@ -211,76 +367,621 @@ class DSE_searcher:
 
                 if (j in converged):
                     continue
+                # Checked before every party's step, since each one simulates
+                # a batch of neighbors
+                if (self.out_of_budget(search_state)):
+                    logging.info("Out of budget in round {0}, before party {1}".format(i, j))
+                    return
                 logging.info("Round {0}, Party: {1}".format(i, j))
                 logging.info("Exploring node: {0}".format((self.fitness_vals[j], self.sys_configs[j])))
                 # Each party will start a hill climbing search during each iteration
-                new_sys_config, new_fitness = self.search_neighbors(self.sys_configs[j], self.fitness_vals[j], search_state)
+                new_position, new_fitness = self.search_neighbors(positions[j], self.fitness_vals[j], search_state,
+                                                                  [previous[j]])
 
-                # TODO Implement plateau exploration
-                if (new_sys_config == self.sys_configs[j]):
+                # A plateau ends the climb, search_tabu() explores them
+                if (new_position == positions[j] and self.all_directions()):
                     # Current nodes is a local max or min
                     logging.info("Search party {0} has converged.".format(j))
                     converged.append(j)
-                self.sys_configs[j] = new_sys_config
+                elif (new_position != positions[j]):
+                    previous[j] = positions[j]
+                    positions[j] = new_position
+                    self.sys_configs[j] = self.index_to_config(new_position)
                 self.fitness_vals[j] = new_fitness
 
 
+    def search_hill_climber_concurrent(self, search_state):
+        """
+        Hill climbing search where every search party advances as soon as its
+        own neighbors have been simulated, instead of waiting for the other
+        parties.  Simulations are shared through the search state, so parties
+        reaching the same config only simulate it once.
+        """
+
+        # Initialize fitness scores for each configuration
+        self.fitness_vals = self.eval_configs(self.sys_configs, search_state)
+
+        positions = [self.config_to_index(c) for c in self.sys_configs]
+        previous = [None] * self.num_search_parties
+        iterations = [0] * self.num_search_parties
+
+        # Search party -> (neighbors being evaluated, their pending simulations)
+        running = {}
+        for j in range(self.num_search_parties):
+            running[j] = self.submit_neighbors(positions[j], search_state)
+
+        while (len(running) > 0):
+            pending = [f for (_, futures) in running.values() for f in futures]
+            wait(pending, return_when = FIRST_COMPLETED)
+
+            for j in list(running.keys()):
+                neighbors, futures = running[j]
+                if (not all(f.done() for f in futures)):
+                    continue
+
+                logging.info("Round {0}, Party: {1}".format(iterations[j], j))
+                logging.info("Exploring node: {0}".format((self.fitness_vals[j], self.sys_configs[j])))
+                # Every simulation is done, so this is only scoring
+                fitnesses = self.eval_indices(neighbors, search_state)
+                new_position, new_fitness = self.select_neighbor(positions[j],
+                        self.fitness_vals[j], neighbors, fitnesses)
+                iterations[j] += 1
+
+                if (new_position == positions[j] and self.all_directions()):
+                    # Current nodes is a local max or min
+                    logging.info("Search party {0} has converged.".format(j))
+                    del running[j]
+                elif (iterations[j] == self.max_iterations or self.out_of_budget(search_state)):
+                    del running[j]
+                else:
+                    # Hand the next step of this party to the workers, without
+                    # the config it came from
+                    if (new_position != positions[j]):
+                        previous[j] = positions[j]
+                    running[j] = self.submit_neighbors(new_position, search_state, [previous[j]])
+
+                positions[j] = new_position
+                self.sys_configs[j] = self.index_to_config(new_position)
+                self.fitness_vals[j] = new_fitness
+
+    def search_annealing(self, search_state):
+        """
+        Simulated annealing.  Every step, each party proposes a random
+        neighbor and moves there if it is better, or otherwise with
+        probability exp(-(fitness increase) / temperature).  The temperature
+        starts at self.initial_temperature and is multiplied by
+        self.cooling_rate after every step.  The proposals of all parties are
+        evaluated as one batch.
+
+        Runs for max_iterations steps or until the budget is spent.  The best
+        config each party visited ends up in self.sys_configs.
+        """
+        self.fitness_vals = self.eval_configs(self.sys_configs, search_state)
+
+        positions = [self.config_to_index(c) for c in self.sys_configs]
+        current = list(self.fitness_vals)
+        temperature = self.initial_temperature
+
+        for i in range(self.max_iterations):
+            if (self.out_of_budget(search_state)):
+                logging.info("Out of budget after {0} steps".format(i))
+                break
+
+            proposals = [r.choice(self.gen_neighbor_indices(p, search_state) or [p]) for p in positions]
+            fitnesses = self.eval_indices(proposals, search_state)
+
+            for j in range(self.num_search_parties):
+                if (self.accept(current[j], fitnesses[j], temperature)):
+                    positions[j] = proposals[j]
+                    current[j] = fitnesses[j]
+                    if (current[j] < self.fitness_vals[j]):
+                        self.sys_configs[j] = self.index_to_config(positions[j])
+                        self.fitness_vals[j] = current[j]
+
+            logging.info("Step {0}, temperature {1}: {2}".format(i, temperature, current))
+            temperature *= self.cooling_rate
+
+    def search_tabu(self, search_state):
+        """
+        Tabu search.  Every party remembers the last self.tabu_tenure configs
+        it visited, and each step moves to its best neighbor that isn't one of
+        them, even if it is worse than where it is.  So parties walk across
+        plateaus and out of local optima instead of stopping there.
+
+        Neighbors already scored during the search are not evaluated again,
+        and the new neighbors of all parties are evaluated as one batch.  A
+        party stops once every neighbor is tabu, or it has taken
+        self.tabu_tenure worsening steps without improving on its best
+        config.  Moves between configs of the same fitness don't count, so a
+        plateau is crossed within max_iterations or the budget.  The best
+        config each party visited ends up in self.sys_configs.
+        """
+        self.fitness_vals = self.eval_configs(self.sys_configs, search_state)
+
+        positions = [self.config_to_index(c) for c in self.sys_configs]
+        scores = dict(zip(positions, self.fitness_vals))
+        tabu = [deque([p], maxlen = self.tabu_tenure) for p in positions]
+        stalled = [0] * self.num_search_parties
+        active = list(range(self.num_search_parties))
+
+        for i in range(self.max_iterations):
+            if (len(active) == 0):
+                return
+
+            if (self.out_of_budget(search_state)):
+                logging.info("Out of budget after {0} rounds".format(i))
+                return
+
+            candidates = dict((j, [n for n in self.gen_search_neighbors(positions[j], search_state) if not n in tabu[j]])
+                              for j in active)
+            self.score_new([n for j in active for n in candidates[j]], scores, search_state)
+
+            for j in list(active):
+                if (len(candidates[j]) == 0):
+                    logging.info("Search party {0} is boxed in.".format(j))
+                    active.remove(j)
+                    continue
+
+                # The candidates are shuffled, so ties are broken at random
+                left = scores[positions[j]]
+                positions[j] = min(candidates[j], key = lambda n: scores[n])
+                tabu[j].append(positions[j])
+                logging.info("Round {0}, Party: {1}, moved to {2}".format(i, j, (scores[positions[j]], positions[j])))
+
+                if (scores[positions[j]] < self.fitness_vals[j]):
+                    self.sys_configs[j] = self.index_to_config(positions[j])
+                    self.fitness_vals[j] = scores[positions[j]]
+                    stalled[j] = 0
+                elif (scores[positions[j]] != left):
+                    # Moves along a plateau aren't stalls, or a party would
+                    # give up before crossing it
+                    stalled[j] += 1
+                    if (stalled[j] >= self.tabu_tenure):
+                        logging.info("Search party {0} has stalled.".format(j))
+                        active.remove(j)
+
+    def search_genetic(self, search_state):
+        """
+        Genetic algorithm over the index tuples.  The first population is the
+        search party seeds topped up with Latin hypercube samples to
+        self.population_size configs.  Each of max_iterations generations
+        breeds as many offspring by tournament, crossover and mutation, and
+        hands them to the search state as one batch, on the worker pool if
+        there is one.  Offspring that were already scored, like repeats of
+        earlier configs, cost nothing.  The best self.population_size
+        configs of parents and offspring survive.
+
+        Stops early once the budget is spent.  The best configs found end up
+        in self.sys_configs, one per party.
+        """
+        scores = {}
+        population = self.sample_indices(self.population_size)
+        self.score_new(population, scores, search_state)
+
+        for i in range(self.max_iterations):
+            if (self.out_of_budget(search_state)):
+                logging.info("Out of budget after {0} generations".format(i))
+                break
+
+            offspring = []
+            while (len(offspring) < self.population_size):
+                a = self.tournament(population, scores)
+                b = self.tournament(population, scores)
+                offspring.append(self.mutate(self.crossover(a, b)))
+            self.score_new(offspring, scores, search_state)
+
+            combined = list(dict.fromkeys(population + offspring))
+            population = sorted(combined, key = lambda index: scores[index])[:self.population_size]
+            logging.info("Generation {0}: best fitness {1}".format(i, scores[population[0]]))
+
+        self.set_best(sorted(((fitness, index) for (index, fitness) in scores.items()), key = lambda x: x[0]))
+
+    def score_new(self, indices, scores, search_state):
+        """
+        Evaluates the index tuples missing from scores, a dictionary of index
+        tuple -> fitness, as one batch and adds them.  NaN fitnesses are
+        scored inf.
+        """
+        new = list(dict.fromkeys(index for index in indices if not index in scores))
+        for (index, fitness) in zip(new, self.eval_indices(new, search_state)):
+            scores[index] = float("inf") if math.isnan(fitness) else fitness
+
+    def accept(self, current_fitness, fitness, temperature):
+        """
+        Metropolis criterion of simulated annealing
+        """
+        if (math.isnan(fitness) or fitness == float("inf")):
+            return False
+
+        if (fitness <= current_fitness or current_fitness == float("inf")):
+            return True
+
+        if (temperature <= 0):
+            return False
+
+        return r.random() < math.exp(-(fitness - current_fitness) / temperature)
+
+    def out_of_budget(self, search_state):
+        """
+        Determines whether the current search() has simulated
+        self.max_simulations sys_configs or run for self.time_limit seconds
+        """
+        if (self.max_simulations is not None and
+            search_state.simulations - self.start_simulations >= self.max_simulations):
+            return True
+
+        return (self.time_limit is not None and
+                time.monotonic() - self.start_time >= self.time_limit)
+
+    def submit_neighbors(self, index, search_state, exclude = ()):
+        """
+        Dispatches the simulations of one hill climbing step from index,
+        except to the neighbors in exclude, to the worker pool.  Returns the
+        neighbors and the futures they wait on.
+        """
+        neighbors = [n for n in self.gen_search_neighbors(index, search_state) if not n in exclude]
+        configs = [self.index_to_config(n) for n in neighbors]
+        return (neighbors, search_state.submit(configs, self.executor))
+
     def search_a_star(self, search_state):
         """
         Implements A* search algorithm from the first seed configuration given
         for an exhaustive search of the search space.
+
+        States are index tuples (see config_to_index()).  A state is marked
+        explored as soon as it is pushed and its fitness never changes, so each
+        state enters the heap at most once.
         """
-        explored = set()
+        start = self.config_to_index(self.sys_configs[0])
+        explored = set([start])
         frontier = []
+        # Ties in fitness are broken by insertion order, so states are never
+        # compared with each other
+        order = it.count()
 
-        frontier.append((search_state.eval_fitness(self.sys_configs[0]), self.sys_configs[0]))
+        heapq.heappush(frontier, (search_state.eval_fitness(self.sys_configs[0]), next(order), start))
 
         best = frontier[0]
 
-
         while (len(frontier) > 0):
-            frontier.sort(key = lambda x: x[0], reverse=True)
-            (fitness, sys_config) = frontier.pop()
+            (fitness, _, index) = heapq.heappop(frontier)
 
-            logging.info("Exploring node: {0}".format((fitness, sys_config)))
+            logging.info("Exploring node: {0}".format((fitness, index)))
 
             if (fitness < best[0]):
-                best = (fitness, sys_config)
+                best = (fitness, 0, index)
 
-            neighbors = self.gen_neighbors(sys_config)
+            neighbors = [n for n in self.gen_neighbor_indices(index, search_state) if not n in explored]
+            explored.update(neighbors)
 
-            for config in neighbors:
-                if (not hashabledict(config) in explored):
-                    frontier.append( (search_state.eval_fitness(config), config) )
-                    explored.add(hashabledict(config))
+            fitnesses = self.eval_configs([self.index_to_config(n) for n in neighbors], search_state)
+            for n, n_fitness in zip(neighbors, fitnesses):
+                heapq.heappush(frontier, (n_fitness, next(order), n))
 
+        self.sys_configs[0] = self.index_to_config(best[2])
+        self.fitness_vals[0] = best[0]
+        logging.info("Best config: {0}".format((best[0], self.sys_configs[0])))
 
-        logging.info("Best config: {0}".format(best))
+    def search_exhaustive(self, search_state):
+        """
+        Evaluates the full Cartesian product of the parameter ranges,
+        self.chunk_size configs at a time.  If every simulator is vectorized
+        (MockSim), each chunk is one eval_fitness_columns() call and the
+        configs are not recorded.  Otherwise the configs of each chunk are
+        evaluated as a batch, on the worker pool if there is one.
+
+        The best config ends up in self.sys_configs[0], with its stats
+        recorded for the job output.
+        """
+        import numpy as np
+
+        total = int(np.prod(self.param_sizes))
+        values = [np.asarray(self.param_ranges[key]) for key in self.param_keys]
+        vectorized = search_state.vectorized()
+
+        best = (float("inf"), 0)
+        for start in range(0, total, self.chunk_size):
+            flat = np.arange(start, min(start + self.chunk_size, total))
+            indices = np.unravel_index(flat, self.param_sizes)
+
+            if (vectorized):
+                columns = dict((key, values[i][indices[i]]) for (i, key) in enumerate(self.param_keys))
+                fitnesses = search_state.eval_fitness_columns(columns)
+            else:
+                chunk = list(zip(*(i.tolist() for i in indices)))
+                fitnesses = np.asarray(self.eval_indices(chunk, search_state), dtype = float)
 
+            fitnesses[np.isnan(fitnesses)] = float("inf")
+            i = int(np.argmin(fitnesses))
+            if (fitnesses[i] < best[0]):
+                best = (float(fitnesses[i]), int(flat[i]))
 
-    def gen_neighbors(self, sys_config):
+        index = tuple(int(i) for i in np.unravel_index(best[1], self.param_sizes))
+        self.sys_configs[0] = self.index_to_config(index)
+        self.fitness_vals[0] = search_state.eval_fitness(self.sys_configs[0])
+        logging.info("Best config: {0}".format((self.fitness_vals[0], self.sys_configs[0])))
+
+    def search_bayesian(self, search_state):
         """
-        Determine all possible neighbors of the given config
+        Bayesian optimization.  The search party seeds, topped up with Latin
+        hypercube samples to self.initial_samples configs, are simulated
+        first.  Then each of max_iterations rounds fits surrogate models to
+        every config simulated so far (see surrogate.py) and simulates the
+        num_search_parties configs with the best expected improvement times
+        probability of satisfying the constraints.
+
+        The best configs found end up in self.sys_configs, one per party.
+        """
+        import numpy as np
+        from surrogate import constrained_acquisition, select_batch
+
+        scale = np.array([max(size - 1, 1) for size in self.param_sizes], dtype = float)
+
+        num_initial = self.initial_samples
+        if (num_initial is None):
+            num_initial = max(self.num_search_parties, len(self.param_sizes) + 1)
+
+        evaluated = self.sample_indices(num_initial)
+        fitnesses = list(self.eval_indices(evaluated, search_state))
+
+        for i in range(0, self.max_iterations):
+            candidates = self.bayesian_candidates(set(evaluated))
+            if (len(candidates) == 0):
+                break
+
+            X = np.array(evaluated, dtype = float) / scale
+            stats = [search_state.merged_stats(self.index_to_config(index)) for index in evaluated]
+            points = np.array(candidates, dtype = float) / scale
+            acquisition = constrained_acquisition(X, np.array(fitnesses, dtype = float), stats,
+                                                  search_state.constraints, points)
+
+            batch = [candidates[c] for c in select_batch(acquisition, points, self.num_search_parties)]
+            fitnesses += self.eval_indices(batch, search_state)
+            evaluated += batch
+            logging.info("Round {0}: best fitness {1}".format(i, min(fitnesses)))
+
+        order = sorted(range(len(evaluated)), key = lambda i: fitnesses[i])
+        for (party, i) in enumerate(order[:len(self.sys_configs)]):
+            self.sys_configs[party] = self.index_to_config(evaluated[i])
+            self.fitness_vals[party] = fitnesses[i]
+
+    def search_successive_halving(self, search_state):
+        """
+        Successive halving over the benchmark options in self.fidelities.
+        The search party seeds, topped up with Latin hypercube samples to
+        self.initial_samples configs (by default enough for num_search_parties
+        to reach the last options), are simulated with the cheapest options.
+        Only the best 1 / self.halving_rate of them are simulated again with
+        the next options, and so on.
+
+        The best configs at the last options end up in self.sys_configs, one
+        per party, and the search state is left at the last options.
+        """
+        fidelities = self.fidelities or [search_state.options]
+
+        num_initial = self.initial_samples
+        if (num_initial is None):
+            num_initial = self.num_search_parties * self.halving_rate**(len(fidelities) - 1)
+
+        self.set_best(self.successive_halving(self.sample_indices(num_initial), 0, search_state))
+
+    def search_hyperband(self, search_state):
+        """
+        Hyperband: successive halving brackets that trade the number of
+        configs for the options they start at, from many configs screened
+        with the cheapest options down to a few simulated with the last
+        options only.  Guards against cheap options that rank configs badly.
+
+        The best configs at the last options over all brackets end up in
+        self.sys_configs, one per party.
+        """
+        fidelities = self.fidelities or [search_state.options]
+        last = len(fidelities) - 1
+        ranked = {}
+
+        for bracket in range(last, -1, -1):
+            n = self.num_search_parties * math.ceil((last + 1) / (bracket + 1) * self.halving_rate**bracket)
+            if (bracket == last):
+                indices = self.sample_indices(n)
+            else:
+                indices = list(dict.fromkeys(latin_hypercube_seeds(self.param_sizes, n, 0)))
+
+            for (fitness, index) in self.successive_halving(indices, last - bracket, search_state):
+                ranked[index] = fitness
+            logging.info("Bracket {0}: best fitness {1}".format(bracket, min(ranked.values())))
+
+        self.set_best(sorted((fitness, index) for (index, fitness) in ranked.items()))
+
+    def successive_halving(self, indices, first, search_state):
+        """
+        Evaluates the index tuples with the options self.fidelities[first],
+        then keeps the best 1 / self.halving_rate of them (at least
+        num_search_parties, and only the feasible ones if any) for each of
+        the following options.  Returns the (fitness, index) pairs evaluated
+        with the last options, best first.
+        """
+        fidelities = self.fidelities or [search_state.options]
+
+        for rung in range(first, len(fidelities)):
+            search_state.set_options(fidelities[rung])
+            fitnesses = self.eval_indices(indices, search_state)
+            ranked = sorted(((float("inf") if math.isnan(f) else f, index)
+                             for (f, index) in zip(fitnesses, indices)), key = lambda x: x[0])
+            logging.info("Options {0}: {1} configs, best fitness {2}".format(
+                    fidelities[rung], len(indices), ranked[0][0]))
+
+            keep = max(self.num_search_parties, math.ceil(len(ranked) / self.halving_rate))
+            promoted = [x for x in ranked[:keep] if x[0] != float("inf")] or ranked[:keep]
+            indices = [index for (_, index) in promoted]
+
+        return ranked
+
+    def search_nsga2(self, search_state):
+        """
+        NSGA-II multi-objective search over the objectives of search_state
+        (the raw stats, see SearchState.objective_names()) rather than its
+        fitness.  The first population is the search party seeds topped up
+        with Latin hypercube samples to self.population_size configs.  Each
+        of max_iterations generations breeds as many offspring by tournament,
+        crossover and mutation, evaluates them as one batch, and keeps the
+        best of parents and offspring by Pareto rank, then crowding distance.
+
+        The Pareto front of every config simulated ends up in
+        self.pareto_front, for search_state.generate_job_output(), and its
+        best configs under the fitness function in self.sys_configs.
+        """
+        population = self.sample_indices(self.population_size)
+        self.eval_indices(population, search_state)
+
+        for i in range(self.max_iterations):
+            ranks = self.pareto_rank(population, search_state)
+            offspring = []
+            while (len(offspring) < self.population_size):
+                a = self.tournament(population, ranks)
+                b = self.tournament(population, ranks)
+                offspring.append(self.mutate(self.crossover(a, b)))
+            self.eval_indices(offspring, search_state)
+
+            combined = list(dict.fromkeys(population + offspring))
+            ranks = self.pareto_rank(combined, search_state)
+            population = sorted(combined, key = lambda index: ranks[index])[:self.population_size]
+            logging.info("Generation {0}: {1} configs on the first front".format(
+                    i, sum(1 for index in population if ranks[index][0] == 0)))
+
+        self.pareto_front = search_state.pareto_front()
+        best = list(dict.fromkeys([self.config_to_index(sys_config) for sys_config in self.pareto_front] +
+                                  population))
+        fitnesses = self.eval_indices(best, search_state)
+        self.set_best(sorted(zip(fitnesses, best), key = lambda x: x[0]))
+
+    def pareto_rank(self, indices, search_state):
+        """
+        Returns index tuple -> (front number, minus crowding distance) of
+        evaluated index tuples, which sorts them best first
+        """
+        from pareto import crowding_distance, non_dominated_sort
+
+        F = search_state.objective_matrix([self.index_to_config(index) for index in indices])
+        ranks = {}
+        for (rank, front) in enumerate(non_dominated_sort(F)):
+            for (i, distance) in zip(front, crowding_distance(F[front])):
+                ranks[indices[i]] = (rank, -distance)
+
+        return ranks
+
+    def tournament(self, population, ranks):
+        """
+        Binary tournament: the better of two random members of the population
+        """
+        a = r.choice(population)
+        b = r.choice(population)
+        return a if ranks[a] <= ranks[b] else b
+
+    def crossover(self, a, b):
         """
+        Uniform crossover: each parameter comes from either parent
+        """
+        return tuple(x if r.random() < 0.5 else y for (x, y) in zip(a, b))
+
+    def mutate(self, index):
+        """
+        Redraws each parameter with probability self.mutation_rate
+        """
+        rate = self.mutation_rate
+        if (rate is None):
+            rate = 1 / len(self.param_sizes)
+
+        return tuple(r.randrange(size) if r.random() < rate else i
+                     for (i, size) in zip(index, self.param_sizes))
+
+    def sample_indices(self, N):
+        """
+        Returns the search party seeds, topped up with Latin hypercube
+        samples to N index tuples (fewer if some samples coincide)
+        """
+        indices = [self.config_to_index(sys_config) for sys_config in self.sys_configs]
+        if (len(indices) < N):
+            indices += latin_hypercube_seeds(self.param_sizes, N - len(indices), 0)
+
+        return list(dict.fromkeys(indices))
+
+    def set_best(self, ranked):
+        """
+        Places the best of a list of (fitness, index) pairs, sorted best
+        first, in self.sys_configs and self.fitness_vals, one per party
+        """
+        for (party, (fitness, index)) in enumerate(ranked[:len(self.sys_configs)]):
+            self.sys_configs[party] = self.index_to_config(index)
+            self.fitness_vals[party] = fitness
+        logging.info("Best config: {0}".format((self.fitness_vals[0], self.sys_configs[0])))
 
+    def bayesian_candidates(self, evaluated):
+        """
+        Returns the index tuples the acquisition function is evaluated on:
+        every config not evaluated yet, or a random sample of
+        self.candidate_limit of them for large search spaces
+        """
+        total = 1
+        for size in self.param_sizes:
+            total *= size
+
+        if (total <= self.candidate_limit):
+            candidates = [index for index in it.product(*(range(size) for size in self.param_sizes))
+                          if not index in evaluated]
+        else:
+            candidates = set()
+            for _ in range(self.candidate_limit):
+                index = tuple(r.randrange(size) for size in self.param_sizes)
+                if (not index in evaluated):
+                    candidates.add(index)
+            candidates = list(candidates)
+
+        # Ties in acquisition are broken at random
+        r.shuffle(candidates)
+        return candidates
+
+    def config_to_index(self, sys_config):
+        """
+        Encodes a config as a tuple of indices into the parameter ranges
+        """
+        try:
+            return tuple(self.param_indices[key][sys_config[key]] for key in self.param_keys)
+        except KeyError:
+            raise ValueError("Current value not in range.")
+
+    def index_to_config(self, index):
+        """
+        Decodes a tuple of indices into the parameter ranges back into a config
+        """
+        return dict((key, self.param_ranges[key][i]) for (key, i) in zip(self.param_keys, index))
+
+    def gen_neighbor_indices(self, index, search_state = None):
+        """
+        Determine all possible neighbors of the given index tuple.  Given a
+        search_state, the neighbors it knows violate a constraint from its
+        monotonicity hints are discarded (see
+        SearchState.implied_violations()).
+        """
         neighbors = []
-        for key in sys_config.keys():
-            # If the parameter has a 'next' element, add a neighbor of the next
-            # element
-            if (param_has_next(sys_config[key], self.param_ranges[key])):
-                config = copy.deepcopy(sys_config)
-                config[key] = param_next(sys_config[key], self.param_ranges[key])
-                neighbors.append(config)
-
-            # If the parameter has a 'prev' element, add a neighbor of the
-            # previous element
-            if (param_has_prev(sys_config[key], self.param_ranges[key])):
-                config = copy.deepcopy(sys_config)
-                config[key] = param_prev(sys_config[key], self.param_ranges[key])
-                neighbors.append(config)
+        for d in range(len(index)):
+            if (index[d] < self.param_sizes[d] - 1):
+                neighbors.append(index[:d] + (index[d] + 1,) + index[d + 1:])
+            if (index[d] > 0):
+                neighbors.append(index[:d] + (index[d] - 1,) + index[d + 1:])
+
+        if (search_state is not None and len(search_state.violations) > 0):
+            neighbors = [n for n in neighbors
+                         if len(search_state.implied_violations(self.index_to_config(n))) == 0]
 
         return neighbors
 
+    def gen_neighbors(self, sys_config, search_state = None):
+        """
+        Determine all possible neighbors of the given config
+        """
+        return [self.index_to_config(n)
+                for n in self.gen_neighbor_indices(self.config_to_index(sys_config), search_state)]
+
     def get_best_sys_config(self, sys_configs, fitnesses):
         best = min(zip(sys_configs, fitnesses),
                    key = lambda x: x[1])
@@ -288,45 +989,74 @@ class DSE_searcher:
 
         return best
 
-    def search_neighbors(self, sys_config, current_fitness, search_state):
+    def search_neighbors(self, index, current_fitness, search_state, exclude = ()):
         """
-        Searches neighbor nodes to see if they provide a better score
+        Searches the neighbor nodes of an index tuple, except those in
+        exclude, to see if they provide a better score
         """
 
-        if (self.search_directions == -1):
-            search_dirs = len(sys_config)
-        elif (self.search_directions == 0):
-            self.search_directions = 1
-        else:
-            search_dirs = max(len(sys_config), self.search_directions)
-
         # Generate possible neighbors
-        neighbor_configs = self.gen_neighbors(sys_config)
+        neighbors = [n for n in self.gen_search_neighbors(index, search_state) if not n in exclude]
+
+        # Evaluate each neighbor according to our evaluation function
+        fitnesses = self.eval_indices(neighbors, search_state)
+
+        return self.select_neighbor(index, current_fitness, neighbors, fitnesses)
+
+    def gen_search_neighbors(self, index, search_state = None):
+        """
+        Generates the neighbors of an index tuple that one step of the hill
+        climber will evaluate
+        """
 
-        # Permute order of neighbors, just in case we're not searching through
-        # all of them
-        r.shuffle(neighbor_configs)
+        if (self.search_directions == 0 or self.search_directions < -1):
+            raise ValueError("Search directions must be -1 (all) or strictly positive.")
 
-        fitnesses = []
-        for n in neighbor_configs:
-            # Evaluate each neighbor according to our evaluation function
-            fitnesses.append(search_state.eval_fitness(n))
+        neighbors = self.gen_neighbor_indices(index, search_state)
+        if (not self.all_directions()):
+            # Only keep the neighbors along k random dimensions
+            dims = set(r.sample(range(len(index)), self.search_directions))
+            neighbors = [n for n in neighbors
+                         if any(n[d] != index[d] for d in dims)]
 
-        neighbor_configs.append(sys_config)
-        fitnesses.append(current_fitness)
+        # Permute order of neighbors
+        r.shuffle(neighbors)
+
+        return neighbors
+
+    def all_directions(self):
+        """
+        Determines whether each hill climbing step evaluates every neighbor
+        """
+        return self.search_directions == -1 or self.search_directions >= len(self.param_sizes)
+
+    def select_neighbor(self, index, current_fitness, neighbors, fitnesses):
+        """
+        Chooses the next node of the hill climber from the evaluated neighbors
+        """
+
+        neighbors = neighbors + [index]
+        fitnesses = fitnesses + [current_fitness]
         if (self.algorithm == Search_Algorithm.Elitist_Hill_Climber):
 
-            next_config, next_fitness = self.get_best_sys_config(neighbor_configs, fitnesses)
+            next_index, next_fitness = self.get_best_sys_config(neighbors, fitnesses)
 
             # If we've hit a plateau, terminate early.
             # TODO Do more informed plateau exploration
             if (next_fitness == current_fitness):
-                next_config = sys_config
+                next_index = index
                 next_fitness = current_fitness
         elif (self.algorithm == Search_Algorithm.Stochastic_Hill_Climber):
-            # TODO choose neighbor with probability proportional to their
-            # relative score
-            next_config = sys_config
-            next_fitness = fitnesses
+            # Choose an improving neighbor with probability proportional to
+            # its improvement
+            improving = [(n, f) for (n, f) in zip(neighbors, fitnesses) if f < current_fitness]
+            if (len(improving) == 0):
+                next_index = index
+                next_fitness = current_fitness
+            elif (current_fitness == float("inf")):
+                next_index, next_fitness = r.choice(improving)
+            else:
+                weights = [current_fitness - f for (_, f) in improving]
+                next_index, next_fitness = r.choices(improving, weights)[0]
 
-        return next_config, next_fitness
+        return next_index, next_fitness
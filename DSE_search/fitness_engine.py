@@ -0,0 +1,212 @@
+import math
+
+"""
+Batch scoring of fitness functions and constraints.
+
+The fitness profiles (embedded, balanced, high performance...) are weighted
+sums of z-scores of a few stats:
+    sum_i w[i] * (stats[features[i]] - m[i]) / s[i]
+
+LinearFitness keeps the features, means, standard deviations and weights as
+arrays, so a whole batch of stats rows can be scored with one matrix product,
+and the constraints applied as vectorized masks over the same rows.
+StatsTable keeps the rows in columnar form, so rescoring every cached config
+under another profile doesn't have to gather the stats again.
+
+NumPy is only needed for the batch functions, and is imported when they are
+first used.
+"""
+
+class LinearFitness:
+    """
+    Weighted z-score fitness function.  Instances are called on one merged
+    stats dictionary like any other fitness function, or score a batch of
+    them with score_batch().
+
+    Members:
+        features
+            Names of the stats used
+        m, s, w
+            Mean, standard deviation and weight of each feature
+        required_stats
+            The stats read, see uses_stats()
+    """
+
+    def __init__(self, features, m, s, w):
+        if (not len(features) == len(m) == len(s) == len(w)):
+            raise ValueError("Features, means, deviations and weights must have the same length.")
+
+        if (any(x == 0 for x in s)):
+            raise ValueError("Standard deviations must be non-zero.")
+
+        self.features = list(features)
+        self.m = list(m)
+        self.s = list(s)
+        self.w = list(w)
+        self.required_stats = tuple(features)
+
+    def __call__(self, stats):
+        result = 0
+
+        for i in range(len(self.features)):
+            result += ((stats[self.features[i]] - self.m[i]) / self.s[i]) * self.w[i]
+
+        return result
+
+    def score_matrix(self, X):
+        """
+        Scores the rows of X, a NumPy array with one column per feature in
+        the order of self.features
+        """
+        import numpy as np
+
+        coefficients = np.asarray(self.w, dtype = float) / np.asarray(self.s, dtype = float)
+        offset = float(np.dot(coefficients, np.asarray(self.m, dtype = float)))
+        return X @ coefficients - offset
+
+    def score_batch(self, stats_rows):
+        """
+        Scores a list of merged stats dictionaries (or a StatsTable),
+        returning a NumPy array
+        """
+        return self.score_matrix(stats_matrix(stats_rows, self.features))
+
+class StatsTable:
+    """
+    Stats rows that are gathered into NumPy columns once, the first time a
+    column is used, and only extended for rows added afterwards.  Can be
+    passed anywhere a list of stats dictionaries is expected.
+
+    Members:
+        keys
+            Key of each row (i.e. its sys_config)
+        rows
+            Merged stats dictionary of each row
+        index
+            Key -> row number
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.rows = []
+        self.index = {}
+        self.columns = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def add(self, key, stats):
+        if not key in self.index:
+            self.index[key] = len(self.rows)
+            self.keys.append(key)
+            self.rows.append(stats)
+
+    def column(self, name):
+        import numpy as np
+
+        column = self.columns.get(name)
+        done = 0 if column is None else len(column)
+        if done < len(self.rows):
+            new = stats_matrix(self.rows[done:], [name])[:, 0]
+            column = new if column is None else np.concatenate((column, new))
+            self.columns[name] = column
+
+        return column
+
+    def matrix(self, names):
+        import numpy as np
+
+        if len(names) == 0:
+            return np.empty((len(self.rows), 0))
+
+        return np.column_stack([self.column(name) for name in names])
+
+def stats_matrix(stats_rows, names):
+    """
+    Gathers the named stats of a list of stats dictionaries (or a StatsTable)
+    into a float NumPy array with one row per dictionary.  Missing and
+    non-numeric stats are NaN.
+    """
+    import numpy as np
+
+    if isinstance(stats_rows, StatsTable):
+        return stats_rows.matrix(names)
+
+    nan = float("nan")
+    try:
+        return np.array([[stats.get(name, nan) for name in names] for stats in stats_rows],
+                        dtype = float).reshape(len(stats_rows), len(names))
+    except (TypeError, ValueError):
+        pass
+
+    # Some stat isn't a number (i.e. gem5's 'no_value')
+    X = np.full((len(stats_rows), len(names)), np.nan)
+    for (i, stats) in enumerate(stats_rows):
+        for (j, name) in enumerate(names):
+            value = stats.get(name)
+            if isinstance(value, (int, float)):
+                X[i, j] = value
+
+    return X
+
+def feasible_mask(constraints, stats_rows):
+    """
+    Applies a dictionary of stat name -> RangeString to a list of stats
+    dictionaries.  Returns a boolean NumPy array, False for the rows violating
+    a constraint.  Like SearchState.score(), constraints on stats a row
+    doesn't have are not checked.
+    """
+    import numpy as np
+
+    names = list(constraints.keys())
+    X = stats_matrix(stats_rows, names)
+    feasible = np.ones(len(stats_rows), dtype = bool)
+    for (j, name) in enumerate(names):
+        column = X[:, j]
+        feasible &= np.isnan(column) | constraints[name].mask(column)
+
+    return feasible
+
+def score_batch(fitness_func, constraints, stats_rows):
+    """
+    Scores a list of merged stats dictionaries (or a StatsTable) under
+    fitness_func and the constraints at once.  Rows violating a constraint score inf.
+
+    Fitness functions without a score_batch() (i.e. plain functions) are
+    called on each row.
+    """
+    import numpy as np
+
+    if hasattr(fitness_func, "score_batch"):
+        scores = np.asarray(fitness_func.score_batch(stats_rows), dtype = float)
+    else:
+        scores = np.array([fitness_func(stats) for stats in stats_rows], dtype = float)
+
+    scores[~feasible_mask(constraints, stats_rows)] = math.inf
+    return scores
+
+def score_columns(fitness_func, constraints, columns):
+    """
+    Same as score_batch(), for stats given as a dictionary of stat name ->
+    NumPy array with one entry per config.  Fitness functions without a
+    score_matrix() are called once on the whole columns, so they have to be
+    plain arithmetic (like mock_eval_stats()).
+    """
+    import numpy as np
+
+    n = len(next(iter(columns.values())))
+    if hasattr(fitness_func, "score_matrix"):
+        X = np.column_stack([columns[name] for name in fitness_func.features])
+        scores = fitness_func.score_matrix(X)
+    else:
+        scores = np.broadcast_to(np.asarray(fitness_func(columns), dtype = float), (n,)).copy()
+
+    for name in constraints.keys():
+        if name in columns:
+            column = np.asarray(columns[name], dtype = float)
+            scores[~(np.isnan(column) | constraints[name].mask(column))] = math.inf
+
+    return scores
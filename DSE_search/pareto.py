@@ -0,0 +1,87 @@
+import math
+
+import numpy as np
+
+"""
+Pareto ranking for the multi-objective search (see
+DSE_searcher.search_nsga2()).
+
+Objectives are given as a NumPy array with one row per config and one column
+per stat, all minimized.  Infeasible configs have every objective set to inf,
+so every feasible config dominates them.
+"""
+
+def dominance_matrix(F):
+    """
+    Returns a boolean array D with D[i, j] set if row i of F dominates row j:
+    no worse in every objective and better in at least one
+    """
+    F = np.asarray(F, dtype = float)
+    no_worse = np.all(F[:, None, :] <= F[None, :, :], axis = 2)
+    better = np.any(F[:, None, :] < F[None, :, :], axis = 2)
+    return no_worse & better
+
+def non_dominated_sort(F):
+    """
+    Fast non-dominated sort.  Returns the row numbers of F split into fronts:
+    the rows no other row dominates, then the rows only dominated by the
+    first front, and so on.  Takes O(M N^2) time and O(N^2) memory for N rows
+    of M objectives.
+    """
+    D = dominance_matrix(F)
+    counts = D.sum(axis = 0)
+
+    fronts = []
+    current = np.flatnonzero(counts == 0)
+    while len(current) > 0:
+        fronts.append(current.tolist())
+        counts = counts - D[current].sum(axis = 0)
+        counts[current] = -1
+        current = np.flatnonzero(counts == 0)
+
+    return fronts
+
+def pareto_mask(F):
+    """
+    Returns a boolean NumPy array set for the rows of F on the first front.
+    Rows are culled against the front found so far, so this takes
+    O(M N K) time for a front of K rows, and suits large N better than
+    non_dominated_sort().
+    """
+    F = np.asarray(F, dtype = float)
+    # Rows are visited in lexicographic order, so a row can't dominate one
+    # visited before it
+    order = np.lexsort(F.T[::-1])
+
+    front = []
+    for i in order:
+        if len(front) > 0:
+            P = F[front]
+            if np.any(np.all(P <= F[i], axis = 1) & np.any(P < F[i], axis = 1)):
+                continue
+        front.append(i)
+
+    mask = np.zeros(len(F), dtype = bool)
+    mask[front] = True
+    return mask
+
+def crowding_distance(F):
+    """
+    NSGA-II crowding distance of the rows of F, a front: the sum over the
+    objectives of the normalized gap between each row's two neighbours.  The
+    rows at either end of an objective get inf, so they are always kept.
+    """
+    F = np.asarray(F, dtype = float)
+    distance = np.zeros(len(F))
+    if len(F) <= 2:
+        distance[:] = math.inf
+        return distance
+
+    for j in range(F.shape[1]):
+        order = np.argsort(F[:, j], kind = "stable")
+        f = F[order, j]
+        distance[order[0]] = distance[order[-1]] = math.inf
+        if np.isfinite(f[0]) and np.isfinite(f[-1]) and f[-1] > f[0]:
+            distance[order[1:-1]] += (f[2:] - f[:-2]) / (f[-1] - f[0])
+
+    return distance
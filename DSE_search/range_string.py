@@ -1,13 +1,20 @@
 
 
 
+directions = {"increasing": 1, "decreasing": -1, "independent": 0}
+
 class RangeString:
     """
     Encapsulates the parsing, error checking, and range checking for strings
     which represent hard range constraints.
+
+    monotonic optionally declares how the constrained stat depends on the
+    config parameters: a dictionary of parameter -> "increasing",
+    "decreasing" or "independent", e.g. {"cache_size": "increasing"} for
+    the area.  Parameters that aren't listed may affect the stat in any way.
     """
 
-    def __init__(self, s):
+    def __init__(self, s, monotonic = None):
         if (s[0] != '(' and s[0] != '['):
             raise ValueError("Range string does not match acceptable pattern.")
 
@@ -34,6 +41,18 @@ class RangeString:
         self.lower_inclusive = s[0] == '['
         self.upper_inclusive = s[-1] == ']'
 
+        # Parameter -> 1 if the stat increases with it, -1 if it decreases,
+        # 0 if it doesn't depend on it
+        self.monotonic = {}
+        for (param, direction) in (monotonic or {}).items():
+            if (not direction in directions):
+                raise ValueError("Monotonicity must be increasing, decreasing or independent.")
+            self.monotonic[param] = directions[direction]
+
+    def __str__(self):
+        return "{0}{1}, {2}{3}".format("[" if self.lower_inclusive else "(", self.low,
+                                       self.high, "]" if self.upper_inclusive else ")")
+
     def in_range(self, f):
         """
         Determines whether float f is within the range specified by this range
@@ -49,3 +68,59 @@ class RangeString:
             return False
 
         return True
+
+    def mask(self, values):
+        """
+        Vectorized in_range() for a NumPy array of floats.  Returns a boolean
+        array.
+        """
+
+        if self.lower_inclusive:
+            lower = values >= self.low
+        else:
+            lower = values > self.low
+
+        if self.upper_inclusive:
+            upper = values <= self.high
+        else:
+            upper = values < self.high
+
+        return lower & upper
+
+    def above(self, f):
+        """
+        Determines whether float f is past the upper end of the range
+        specified by this range string.
+        """
+
+        return f > self.high or (not self.upper_inclusive and f == self.high)
+
+    def below(self, f):
+        """
+        Determines whether float f is short of the lower end of the range
+        specified by this range string.
+        """
+
+        return f < self.low or (not self.lower_inclusive and f == self.low)
+
+    def implies_violation(self, violating, sys_config, above):
+        """
+        Determines, from the monotonicity hints alone, that sys_config
+        violates this constraint like the violating config did: past the
+        upper end of the range if above is set, short of the lower end
+        otherwise.  That is the case if sys_config pushes the stat at least
+        as far out of range in every parameter the stat depends on.
+        """
+
+        side = 1 if above else -1
+        for param in set(violating.keys()) | set(sys_config.keys()):
+            direction = self.monotonic.get(param)
+            if (direction is None):
+                if (violating.get(param) != sys_config.get(param)):
+                    return False
+            elif (direction != 0):
+                if (not param in violating or not param in sys_config or
+                    side * direction * (sys_config[param] - violating[param]) < 0):
+                    return False
+
+        return True
@@ -0,0 +1,94 @@
+import json
+import os
+import sqlite3
+
+"""
+Persistent store of simulation results.
+
+Simulations (gem5 in particular) take minutes per config, so the results of
+every simulator run are kept in an SQLite database that outlives the search.
+A result is only reused if everything it depends on matches:
+    the config (in canonical form)
+    the benchmark path and its options
+    the simulator class
+    the simulator fingerprint (see SimWrap.fingerprint())
+
+SQLite serializes writers and the database runs in WAL mode with a generous
+busy timeout, so parallel workers and parallel jobs can share one store.
+"""
+
+def canonical_config(sys_config):
+    """
+    Serializes a config independently of key order and of whether integral
+    values were given as int or float (e.g. 7e9 vs 7000000000)
+    """
+    config = {}
+    for key in sys_config.keys():
+        val = sys_config[key]
+        if isinstance(val, float) and val.is_integer():
+            val = int(val)
+        config[key] = val
+
+    return json.dumps(config, sort_keys=True)
+
+class ResultStore:
+    """
+    Members:
+        get()
+            Returns the stored stats of a simulator run, or None
+        put()
+            Stores the stats of a simulator run
+    """
+
+    def __init__(self, filename, timeout = 60):
+        self.filename = filename
+        self.timeout = timeout
+        self.conn = None
+        self.pid = None
+
+        self.connect().execute("""CREATE TABLE IF NOT EXISTS results (
+                                      simulator TEXT NOT NULL,
+                                      fingerprint TEXT NOT NULL,
+                                      benchmark TEXT NOT NULL,
+                                      options TEXT NOT NULL,
+                                      config TEXT NOT NULL,
+                                      stats TEXT NOT NULL,
+                                      PRIMARY KEY (simulator, fingerprint, benchmark, options, config))""")
+
+    def connect(self):
+        """
+        Returns the connection of the current process.  SQLite connections
+        must not be shared with forked children, so each process opens its own.
+        """
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.filename, timeout = self.timeout,
+                                        isolation_level = None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.pid = os.getpid()
+
+        return self.conn
+
+    def key(self, sim, sys_config, benchmark, options):
+        return (sim.__class__.__name__, sim.fingerprint(), str(benchmark),
+                str(options), canonical_config(sys_config))
+
+    def get(self, sim, sys_config, benchmark, options):
+        row = self.connect().execute("""SELECT stats FROM results WHERE
+                                         simulator = ? AND fingerprint = ? AND benchmark = ? AND
+                                         options = ? AND config = ?""",
+                                     self.key(sim, sys_config, benchmark, options)).fetchone()
+        if row is None:
+            return None
+
+        return json.loads(row[0])
+
+    def put(self, sim, sys_config, benchmark, options, stats):
+        self.connect().execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                               self.key(sim, sys_config, benchmark, options) + (json.dumps(stats),))
+
+    def __getstate__(self):
+        # Connections can't be pickled; the receiving process opens its own
+        state = self.__dict__.copy()
+        state["conn"] = None
+        state["pid"] = None
+        return state
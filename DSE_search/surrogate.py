@@ -0,0 +1,141 @@
+import math
+
+import numpy as np
+
+"""
+Surrogate models for the Bayesian optimization search (see
+DSE_searcher.search_bayesian()).
+
+Configs are points in the unit cube: each parameter's index into its range,
+divided by the size of the range minus one.  A Gaussian process fitted to the
+configs simulated so far predicts the fitness of the others, and the
+acquisition function picks the configs worth simulating next.  Constraints
+are modelled by one Gaussian process per constrained stat, and the expected
+improvement is weighted by the probability that every constraint holds.
+"""
+
+_erf = np.vectorize(math.erf, otypes = [float])
+
+def normal_cdf(z):
+    return 0.5 * (1 + _erf(z / math.sqrt(2)))
+
+def normal_pdf(z):
+    return np.exp(-0.5 * z**2) / math.sqrt(2 * math.pi)
+
+class GaussianProcess:
+    """
+    Gaussian process regression with a squared exponential kernel.  The
+    length scale is picked from length_scales by marginal likelihood each
+    time the model is fitted.
+    """
+
+    def __init__(self, noise = 1e-6, length_scales = (0.1, 0.2, 0.4, 0.8, 1.6)):
+        self.noise = noise
+        self.length_scales = length_scales
+
+    def kernel(self, A, B, length_scale):
+        d = np.sum(A**2, axis = 1)[:, None] + np.sum(B**2, axis = 1)[None, :] - 2 * A @ B.T
+        return np.exp(-0.5 * np.maximum(d, 0) / length_scale**2)
+
+    def fit(self, X, y):
+        """
+        Fits the model to the rows of X and their values y
+        """
+        self.X = np.asarray(X, dtype = float)
+        y = np.asarray(y, dtype = float)
+        self.offset = y.mean()
+        self.scale = y.std() if y.std() > 0 else 1.0
+        y = (y - self.offset) / self.scale
+
+        best = None
+        for length_scale in self.length_scales:
+            K = self.kernel(self.X, self.X, length_scale) + self.noise * np.eye(len(y))
+            try:
+                L = np.linalg.cholesky(K)
+            except np.linalg.LinAlgError:
+                continue
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+            likelihood = -0.5 * y @ alpha - np.sum(np.log(np.diag(L)))
+            if best is None or likelihood > best[0]:
+                best = (likelihood, length_scale, L, alpha)
+
+        if best is None:
+            raise ValueError("Could not fit the Gaussian process.")
+
+        (_, self.length_scale, self.L, self.alpha) = best
+        return self
+
+    def predict(self, X):
+        """
+        Returns the predicted mean and standard deviation at the rows of X
+        """
+        Ks = self.kernel(np.asarray(X, dtype = float), self.X, self.length_scale)
+        mean = Ks @ self.alpha
+        v = np.linalg.solve(self.L, Ks.T)
+        var = np.maximum(1 - np.sum(v**2, axis = 0), 1e-12)
+
+        return (self.offset + self.scale * mean, self.scale * np.sqrt(var))
+
+def expected_improvement(mean, std, best, xi = 0.01):
+    """
+    Expected improvement over best of a minimized objective
+    """
+    improvement = best - mean - xi * abs(best)
+    z = improvement / std
+    return improvement * normal_cdf(z) + std * normal_pdf(z)
+
+def probability_in_range(mean, std, range_string):
+    """
+    Probability that a normally distributed stat lies within a RangeString
+    """
+    upper = normal_cdf((range_string.high - mean) / std) if range_string.high != math.inf else 1.0
+    lower = normal_cdf((range_string.low - mean) / std) if range_string.low != -math.inf else 0.0
+    return np.maximum(upper - lower, 0.0)
+
+def constrained_acquisition(X, fitnesses, stats, constraints, candidates):
+    """
+    Scores the candidate points by expected improvement times the probability
+    of satisfying the constraints.
+
+    X, fitnesses and stats are the points simulated so far, their fitness
+    (inf if infeasible) and their merged stats.  Until a feasible point is
+    found, only the probability of feasibility counts.
+    """
+    feasible = np.isfinite(fitnesses)
+    if np.sum(feasible) > 1:
+        # Fitnesses can span orders of magnitude, so the model is fitted to
+        # their ranks, which keeps the same minimum
+        ranks = np.argsort(np.argsort(fitnesses[feasible])) / (np.sum(feasible) - 1)
+        gp = GaussianProcess().fit(X[feasible], ranks)
+        (mean, std) = gp.predict(candidates)
+        acquisition = expected_improvement(mean, std, 0.0)
+    else:
+        acquisition = np.ones(len(candidates))
+
+    for name in constraints.keys():
+        values = np.array([s.get(name, math.nan) if isinstance(s.get(name), (int, float)) else math.nan
+                           for s in stats], dtype = float)
+        known = np.isfinite(values)
+        if np.sum(known) > 1:
+            gp = GaussianProcess().fit(X[known], values[known])
+            (mean, std) = gp.predict(candidates)
+            acquisition = acquisition * probability_in_range(mean, std, constraints[name])
+
+    return acquisition
+
+def select_batch(acquisition, candidates, k, length_scale = 0.1):
+    """
+    Picks the k best candidates by acquisition, one at a time.  After each
+    pick the acquisition around it is damped, so the batch spreads out
+    instead of piling up on one peak.  Returns the row numbers of the picks.
+    """
+    acquisition = np.array(acquisition, dtype = float)
+    picks = []
+    for _ in range(min(k, len(candidates))):
+        i = int(np.argmax(acquisition))
+        picks.append(i)
+        d = np.sum((candidates - candidates[i])**2, axis = 1)
+        acquisition *= 1 - np.exp(-0.5 * d / length_scale**2)
+        acquisition[i] = -math.inf
+
+    return picks
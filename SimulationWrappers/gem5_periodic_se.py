@@ -0,0 +1,39 @@
+# gem5 configuration script, run by gem5.opt rather than by python:
+#
+#   gem5.opt [gem5 options] gem5_periodic_se.py --stats-period=SECONDS \
+#       --se-script=.../configs/example/se.py [se.py options]
+#
+# Runs se.py unchanged, but dumps the stats every SECONDS of simulated time so
+# they can be read while the simulation is running.  se.py has no option for
+# this, so the dump is scheduled right after it instantiates the system.
+
+import os
+import sys
+
+import m5
+
+def pop_option(name):
+    for arg in sys.argv[1:]:
+        if arg.startswith(name + "="):
+            sys.argv.remove(arg)
+            return arg.split("=", 1)[1]
+
+    raise ValueError("Missing option: " + name)
+
+stats_period = float(pop_option("--stats-period"))
+se_script = pop_option("--se-script")
+
+instantiate = m5.instantiate
+
+def instantiate_with_periodic_dumps(*args, **kwargs):
+    instantiate(*args, **kwargs)
+    m5.stats.periodicStatDump(m5.ticks.fromSeconds(stats_period))
+
+m5.instantiate = instantiate_with_periodic_dumps
+
+# se.py finds the common config modules relative to its own directory
+sys.argv[0] = se_script
+sys.path[0] = os.path.dirname(se_script)
+with open(se_script) as f:
+    code = compile(f.read(), se_script, "exec")
+exec(code, {"__file__": se_script, "__name__": "__m5_main__"})
@@ -1,58 +1,177 @@
 #!/usr/bin/env python3
 
-from simulation_wrapper import SimWrap
+from simulation_wrapper import SimWrap, file_fingerprint
 
 import string
+import logging
 import re
 import json
-import subprocess
 import defs
+import mmap
 import os
 
 config_defaults = { "cpu_count": 1, "cpu_frequency": 9000000, "cache_size": 1024}
 valid_sys_config_params = [ "cpu_count", "cpu_frequency", "cache_size" ]
 
-def nested_stats_insert(stats, fields):
-    # Expecting lines with at least 2 fields separated by whitespace
-    if len(fields) < 2:
-        return
-
-    #
-    # First field is the key, which may have nested attributes
-    # Nested attributes are indicated by the fully qualified name separated by '.'
-    # i.e. 'system.voltage_domain.voltage'
-    #
-    if ("." in fields[0]):
-        # Split out the fully qualified name of the attribute
-        nested_keys = fields[0].split(".")
-        # Retrieve the outermost domain name
-        domain = nested_keys[0]
-
-        #
-        # If this domain has been encoutered before, grab the existing dict
-        # Otherwise, create a new one
-        #
-        if (domain in stats.keys()):
-            nest = stats[domain]
+BEGIN_MARKER = b"Begin Simulation Statistics"
+END_MARKER = b"End Simulation Statistics"
+
+def parse_stats(filename, keys = None):
+    """
+    Parses the last complete dump of a gem5 stats file in a single pass into
+    a flat dictionary keyed by the fully qualified stat names, i.e.
+    'system.voltage_domain.voltage'.  If no dump is complete, i.e. gem5 was
+    killed while writing the first one, the partial dump is parsed.
+
+    Vector and distribution entries keep their '::' suffix, i.e.
+    'system.cpu.op_class::IntAlu'.  Ruby histograms, which list their buckets
+    on one line separated by '|', are stored as a list of bucket counts under
+    the '::buckets' entry of the histogram.
+
+    If keys is given, only the stats named in keys are kept.  Naming a vector,
+    distribution or histogram keeps all of its entries.
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}
+
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            # Periodic dumps are appended to the same file, and the last
+            # complete one covers the whole run
+            end = data.rfind(END_MARKER)
+            if end == -1:
+                end = len(data)
+            begin = data.rfind(BEGIN_MARKER, 0, end)
+            if begin == -1:
+                return {}
+            begin = data.find(b"\n", begin) + 1
+
+            lines = data[begin:end].decode().splitlines()
+
+    return parse_stat_lines(lines, keys)
+
+def parse_stat_lines(lines, keys = None):
+    """
+    Parses the lines of one dump of a gem5 stats file, see parse_stats()
+    """
+    stats = {}
+    for line in lines:
+        fields = line.split(None, 2)
+        if len(fields) < 2:
+            continue
+
+        if (keys is not None and not fields[0] in keys and
+            not fields[0].partition("::")[0] in keys):
+            continue
+
+        if fields[1] == "|":
+            # Strip the description
+            buckets = line.split("#", 1)[0].split("|")[1:]
+            stats[fields[0] + "::buckets"] = [gem5_parse_value(b.split()[0]) for b in buckets if b.strip()]
         else:
-            nest = {}
+            stats[fields[0]] = gem5_parse_value(fields[1])
+
+    return stats
+
+class StatsTail:
+    """
+    Incrementally reads the dumps gem5 appends to a stats file while it is
+    still running
+    """
+
+    def __init__(self, filename, keys = None):
+        self.filename = filename
+        self.keys = keys
+        self.offset = 0
+        self.pending = b""
+
+    def read_dumps(self):
+        """
+        Returns the flat stats of each dump completed since the last call
+        """
+        try:
+            with open(self.filename, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        self.offset += len(data)
+        self.pending += data
+
+        dumps = []
+        while True:
+            end = self.pending.find(END_MARKER)
+            if end == -1:
+                break
+
+            begin = self.pending.rfind(BEGIN_MARKER, 0, end)
+            if begin != -1:
+                begin = self.pending.find(b"\n", begin) + 1
+                dumps.append(parse_stat_lines(self.pending[begin:end].decode().splitlines(), self.keys))
 
-        # Strip the outermost domain from the fully qualified name
-        nested_keys.pop(0)
+            self.pending = self.pending[end + len(END_MARKER):]
 
-        # Insert this value into the nest using the remaining domains
-        nested_stats_insert(nest, [".".join(nested_keys), fields[1]])
+        return dumps
 
-        # Update the main dictionary with this updated nested dictionary
-        stats[domain] = nest
+def flatten_stats(nested, prefix):
+    """
+    Inverse of nest_stats() for one domain: the entries of nested, with
+    their names joined by '.' after prefix
+    """
+    flat = {}
+    for (key, value) in nested.items():
+        if isinstance(value, dict):
+            flat.update(flatten_stats(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
 
-    else:
-        stats[fields[0]] = gem5_parse_value(fields[1])
+    return flat
+
+def nest_stats(flat_stats):
+    """
+    Builds the nested view of flat gem5 stats, where each '.' in a stat name
+    is a level of nesting and a '::' suffix is the innermost key, i.e.
+    'system.cpu.op_class::IntAlu' -> stats['system']['cpu']['op_class']['IntAlu']
+
+    A name that is both a stat and a domain keeps the stat, and the stats of
+    the domain keep the rest of their name, whatever their order.
+    """
+    stats = {}
+    for name in flat_stats.keys():
+        (domains, sep, entry) = name.partition("::")
+        keys = domains.split(".")
+        if sep:
+            keys.append(entry)
+
+        nest = stats
+        for i in range(len(keys) - 1):
+            if not keys[i] in nest.keys():
+                nest[keys[i]] = {}
+            elif not isinstance(nest[keys[i]], dict):
+                # A stat also used as a domain keeps the rest of its name
+                keys = keys[:i] + [".".join(keys[i:])]
+                break
+            nest = nest[keys[i]]
+
+        if isinstance(nest.get(keys[-1]), dict):
+            # A domain turns out to be a stat too
+            nest.update(flatten_stats(nest.pop(keys[-1]), keys[-1] + "."))
+        nest[keys[-1]] = flat_stats[name]
+
+    return stats
 
 def gem5_parse_value(string):
-    if ("." in string or "nan" in string):
+    try:
+        return int(string)
+    except ValueError:
+        pass
+
+    try:
         return float(string)
-    return int(string)
+    except ValueError:
+        # i.e. 'no_value'
+        return string
 
 def gem5_parse_freq(freq):
     prefix = ""
@@ -97,10 +216,29 @@ class Gem5Sim(SimWrap):
     """
     self.config
         simulation configuration
+    self.flat_stats
+        simulation results keyed by fully qualified stat name
     self.stats ## dict of information
-        simulation results
+        simulation results, nested by domain
+    self.aborted
+        constraint name -> stat value of the bounds that made the last run
+        stop early, empty if it ran to completion
+    stats_period
+        Simulated seconds between the periodic stat dumps read while gem5 runs
+        with stat bounds.  None derives it from the bounds.
     """
 
+    config_params = valid_sys_config_params
+    cost = 100
+    filters_stats = True
+    # Stats that only grow while the simulation runs, so a run can be stopped
+    # once one of them is past its bound
+    monotonic_stats = {"sim_seconds": "sim_seconds",
+                       "sim_ticks": "sim_ticks",
+                       "execution time (s)": "sim_seconds",
+                       "execution_time (s)": "sim_seconds"}
+    stats_period = None
+
     def __init__(self, benchmark, options, sys_config = config_defaults):
         """
         Pass in dictionary of simulation parameters
@@ -114,6 +252,11 @@ class Gem5Sim(SimWrap):
         self.set_config(sys_config)
         self.benchmark = benchmark
         self.options = options
+        self.flat_stats = None
+        self.nested_stats = None
+        self.stat_filter = None
+        self.stat_bounds = None
+        self.aborted = {}
 
     def set_config(self, sys_config):
         """
@@ -129,69 +272,164 @@ class Gem5Sim(SimWrap):
 
         pass
 
-    def run_simulation(self):
-        #CPU_TYPE = """ --cpu-type="DerivO3CPU" """
-        #RUBY = " --ruby"
-        #NUM_CPUS = " -n " + str(self.config["cpu_count"])
-        #FREQ = " --cpu-clock=" + gem5_parse_freq(self.config["cpu_frequency"])
-        #L1_CACHE = " --l1d_size=" + gem5_parse_cache(self.config["cache_size"])
-        #OUTPUT = " -d " + defs.ROOT_DIR
-        #OUTPUT = " --stats-file=" + defs.ROOT_DIR + "/stats.txt"
-        #COMMAND = " -c " + defs.BENCHMARK_PATH
-
-        subprocess.check_call("{0} {1} {2} {3} {4} {5} {6} {7} {8} {9} >> {10}".format(\
-                                defs.GEM5_DIR + "/build/X86/gem5.opt", \
-                                "--stats-file=" + defs.ROOT_DIR + "/stats.txt", \
-                                "-r", \
-                                defs.GEM5_DIR + "/configs/example/se.py", \
-                                """--cpu-type="DerivO3CPU" """, \
-                                "--ruby", \
-                                " -n " + str(self.config["cpu_count"]), \
-                                "--cpu-clock=" + gem5_parse_freq(self.config["cpu_frequency"]), \
-                                "--l1d_size=" + gem5_parse_cache(self.config["cache_size"]), \
-                                "-c " + self.benchmark + " --options=" + self.options, \
-                                defs.LOG_DIR + "/gem5.log"), shell=True)
-        subprocess.check_call("/bin/cat " + defs.ROOT_DIR + "/m5out/simout >> " + defs.LOG_DIR + "/gem5.log", shell=True)
-        pass
+    def search_stats(self):
+        """
+        The search records the flat stats, the nested view is only built for
+        the job output
+        """
+        return self.flat_stats
+
+    def output_stats(self, stats):
+        return nest_stats(stats)
+
+    def fingerprint(self):
+        # Results are stored flat
+        fingerprint = "flat:" + file_fingerprint(defs.GEM5_DIR + "/build/X86/gem5.opt",
+                                       defs.GEM5_DIR + "/configs/example/se.py")
+        # Filtered results can't stand in for full ones, and vice versa
+        if self.stat_filter is not None:
+            fingerprint += ":" + ",".join(sorted(self.stat_filter))
+        # Neither can the results of runs stopped at other bounds
+        if self.stat_bounds:
+            fingerprint += ":" + ",".join(name + str(self.stat_bounds[name])
+                                          for name in sorted(self.stat_bounds))
+
+        return fingerprint
+
+    def dump_period(self):
+        """
+        Simulated seconds between periodic stat dumps: self.stats_period, or
+        a twentieth of the tightest bound
+        """
+        if self.stats_period is not None:
+            return self.stats_period
 
-    def parse_stats(self, filename):
-        stats = {}
+        bounds = []
+        for (name, bound) in self.stat_bounds.items():
+            if self.monotonic_stats[name] == "sim_ticks":
+                # gem5 ticks are picoseconds
+                bounds.append(bound.high * 1e-12)
+            else:
+                bounds.append(bound.high)
 
-        f = open(filename, 'r')
+        return min(bounds) / 20
 
-        try:
-            # First two lines of stat file are not data, but let's be smart
-            # about it and instead search for the start of data indicator
-            while ("Begin Simulation Statistics" not in f.readline()):
-                continue
+    def exceeded_bounds(self, stats):
+        """
+        Returns constraint name -> stat value of the bounded stats that are
+        past their bound in the flat stats
+        """
+        exceeded = {}
+        for (name, bound) in (self.stat_bounds or {}).items():
+            stat = self.monotonic_stats[name]
+            if stat in stats and bound.above(float(stats[stat])):
+                exceeded[name] = stats[stat]
 
-            s = f.readline()
-            while (s != "" and "End Simulation Statistics" not in s):
-                # TODO FIXME incorporate new line formats into parser
-                if ("::" in s or "|" in s):
-                    s = f.readline()
-                    continue
+        return exceeded
 
-                nested_stats_insert(stats, s.split())
+    def watch(self, tail):
+        """
+        Reads the stat dumps written since the last call.  Returns True if
+        the run should be stopped because a bounded stat went past its bound.
+        """
+        for dump in tail.read_dumps():
+            self.aborted = self.exceeded_bounds(dump)
+            if self.aborted:
+                logging.info("Stopping gem5, past bounds: {}".format(self.aborted))
+                return True
 
-                s = f.readline()
+        return False
 
-        finally:
-            f.close()
+    def stats_watch(self, run_dir):
+        """
+        Returns the watch() for SimWrap.run_command() that checks the stat
+        dumps of the run in run_dir against the bounds, or None
+        """
+        if not self.stat_bounds:
+            return None
+
+        tail = StatsTail(run_dir + "/stats.txt",
+                         set(self.monotonic_stats[name] for name in self.stat_bounds))
+        return lambda: self.watch(tail)
+
+    def simulation_argv(self, run_dir):
+        # All outputs (stats.txt, config.ini...) go to run_dir
+        argv = [defs.GEM5_DIR + "/build/X86/gem5.opt",
+                "-d", run_dir,
+                "--stats-file=stats.txt"]
+        se_script = defs.GEM5_DIR + "/configs/example/se.py"
+        if self.stat_bounds:
+            argv += [os.path.dirname(os.path.abspath(__file__)) + "/gem5_periodic_se.py",
+                     "--stats-period=" + repr(self.dump_period()),
+                     "--se-script=" + se_script]
+        else:
+            argv.append(se_script)
+
+        return argv + [
+                "--cpu-type=DerivO3CPU",
+                "--ruby",
+                "-n", str(self.config["cpu_count"]),
+                "--cpu-clock=" + gem5_parse_freq(self.config["cpu_frequency"]),
+                "--l1d_size=" + gem5_parse_cache(self.config["cache_size"]),
+                "-c", self.benchmark,
+                "--options=" + self.options]
+
+    def run_simulation(self, run_dir):
+        """
+        Runs gem5 in run_dir.  With stat bounds, the periodic stat dumps are
+        read while gem5 runs, and gem5 is killed as soon as a bounded stat is
+        past its bound.
+        """
+        self.aborted = {}
+        self.run_command(self.simulation_argv(run_dir), run_dir, run_dir + "/gem5.log",
+                         self.stats_watch(run_dir))
+
+    async def run_simulation_async(self, run_dir):
+        self.aborted = {}
+        await self.run_command_async(self.simulation_argv(run_dir), run_dir, run_dir + "/gem5.log",
+                                     self.stats_watch(run_dir))
+
+    @property
+    def stats(self):
+        """
+        Nested view of the flat stats, built the first time it is needed
+        """
+        if self.nested_stats is None and self.flat_stats is not None:
+            self.nested_stats = nest_stats(self.flat_stats)
 
-        return stats
+        return self.nested_stats
 
     def run(self):
         """
         Run the simulation
         Store statistics
         """
-        self.run_simulation()
+        with self.scratch_dir() as run_dir:
+            self.run_simulation(run_dir)
+            self.collect_stats(run_dir)
+
+    async def run_async(self):
+        with self.scratch_dir() as run_dir:
+            await self.run_simulation_async(run_dir)
+            self.collect_stats(run_dir)
+
+    def collect_stats(self, run_dir):
+        """
+        Parses the stats of the run in run_dir.  Bounded stats are also
+        stored under the name of their constraint, so a run that went past a
+        bound fails the constraint check.
+        """
+        bounded = dict((name, self.monotonic_stats[name]) for name in (self.stat_bounds or {}))
+
+        keys = self.stat_filter
+        if keys is not None:
+            keys = set(keys) | set(bounded.values())
 
-        # Collect the statistics
-        filename = defs.ROOT_DIR + "/stats.txt"
-        self.stats = self.parse_stats(filename)
-        os.remove(filename)
+        self.flat_stats = parse_stats(run_dir + "/stats.txt", keys)
+        for (name, stat) in bounded.items():
+            if stat in self.flat_stats:
+                self.flat_stats[name] = self.flat_stats[stat]
+        self.nested_stats = None
 
 def main():
     sim = Gem5Sim()
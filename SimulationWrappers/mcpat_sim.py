@@ -1,30 +1,51 @@
 #!/usr/bin/python3
 
-from simulation_wrapper import SimWrap
-import subprocess
+from simulation_wrapper import SimWrap, SimulationError, file_fingerprint
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import csv
 import defs
+import logging
+import os
 import copy
 
-def parse_csv(filename):
+def parse_csv(filename, fields = None):
     """
-    Parse the output csv for the mcpat simulator.
-    This
+    Parse the output csv for the mcpat simulator.  Runs append a row each, so
+    only the last row is kept while streaming through the file.
+
+    Returns the last row as a dictionary of column name -> float, with 'N/A'
+    as NaN.  Values that aren't numbers are kept as strings.  If fields is
+    given, only those columns are kept.  Returns {} if there is no row.
     """
-    with open(filename, 'r') as csvfile:
+    with open(filename, 'r', newline = '') as csvfile:
         mcpat_data = csv.reader(csvfile, delimiter=',')
 
         # Get field name row
-        names = next(mcpat_data)
+        names = next(mcpat_data, [])
+        last = deque(mcpat_data, maxlen = 1)
+
+    if len(last) == 0:
+        return {}
+
+    record = {}
+    for (name, entry) in zip(names, last[0]):
         # Strip out whitespace and null ending entry
-        names = list(filter(lambda x: x, map(lambda x: x.strip(), names)))
+        name = name.strip()
+        if name and (fields is None or name in fields):
+            record[name] = parse_value(entry)
+
+    return record
 
-        data = dict((name, []) for name in names)
-        for line in mcpat_data:
-            for (name, entry) in zip(names, line):
-                data[name].append(entry)
+def parse_value(entry):
+    entry = entry.strip()
+    if entry == "N/A":
+        return float("nan")
 
-        return data
+    try:
+        return float(entry)
+    except ValueError:
+        return entry
 
 config_defaults = { "cache_size": 1024}
 valid_sys_config_params = ["cache_size"]
@@ -35,8 +56,13 @@ class McPatSim(SimWrap):
         simulation configuration
     self.stats
         simulation results
+    self.table
+        cache_size -> stats of the precomputed runs, see precompute()
     """
 
+    config_params = valid_sys_config_params
+    cost = 1
+
     def __init__(self, sys_config = config_defaults):
         """
         Pass in dictionary of simulation parameters
@@ -44,6 +70,7 @@ class McPatSim(SimWrap):
         """
         self.config = {}
         self.set_config(sys_config)
+        self.table = {}
 
     def set_config(self, sys_config):
         """
@@ -58,11 +85,21 @@ class McPatSim(SimWrap):
         if not all(k in sys_config.keys() for k in valid_sys_config_params):
             raise ValueError("Not a valid McPAT config parameter")
 
-    def run_simulation(self, output_csv):
-        #TODO: Have better error handling for cacti call
-        subprocess.check_call(defs.ROOT_DIR + \
-            "/cacti/cacti -infile cache_config.cfg -outfile {0} >> {1}".format(output_csv, defs.LOG_DIR + "/McPat.log"),
-            shell=True)
+    def fingerprint(self):
+        # Stored results from before the stats were parsed as floats don't match
+        return "typed:" + file_fingerprint(defs.ROOT_DIR + "/cacti/cacti",
+                                           defs.ROOT_DIR + "/cacti/cache_template.cfg")
+
+    def simulation_argv(self, run_dir):
+        return [defs.ROOT_DIR + "/cacti/cacti",
+                "-infile", "cache_config.cfg",
+                "-outfile", "results.csv"]
+
+    def run_simulation(self, run_dir):
+        self.run_command(self.simulation_argv(run_dir), run_dir, run_dir + "/McPat.log")
+
+    async def run_simulation_async(self, run_dir):
+        await self.run_command_async(self.simulation_argv(run_dir), run_dir, run_dir + "/McPat.log")
 
     def gen_cache_config_file(self, template, output_file):
         cache_size = self.config["cache_size"]
@@ -71,23 +108,76 @@ class McPatSim(SimWrap):
             config = config.replace("$CACHE_SIZE", str(cache_size))
             f_out.write(config)
 
+    def precompute(self, param_ranges, max_workers = 1):
+        """
+        Runs cacti for every cache_size in param_ranges, max_workers runs at a
+        time, and keeps the results in self.table so run() only has to look
+        them up.  Sizes that fail are left to run() to report.
+        """
+        sizes = [size for size in param_ranges.get("cache_size", []) if not size in self.table]
+
+        def simulate(size):
+            # Each run gets its own copy, since the config is per instance
+            sim = copy.copy(self)
+            sim.config = dict(self.config)
+            sim.table = {}
+            sim.set_config({"cache_size": size})
+            try:
+                sim.run()
+            except SimulationError as error:
+                logging.warning("Not precomputed: {}".format(error))
+                return None
+            return sim.stats
+
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            for (size, stats) in zip(sizes, executor.map(simulate, sizes)):
+                if stats is not None:
+                    self.table[size] = stats
+
+    def lookup(self):
+        """
+        Takes the stats of the current config from the table.  Returns
+        whether they were there.
+        """
+        if not self.config["cache_size"] in self.table:
+            return False
+
+        self.stats = dict(self.table[self.config["cache_size"]])
+        return True
+
     def run(self):
         """
         Run the simulation
         Store statistics
         """
-        self.gen_cache_config_file(defs.ROOT_DIR + "/cacti/cache_template.cfg", "cache_config.cfg")
-
-        output_csv = "results.csv"
-        self.run_simulation(output_csv)
+        if self.lookup():
+            return
+
+        with self.scratch_dir() as run_dir:
+            self.gen_cache_config_file(defs.ROOT_DIR + "/cacti/cache_template.cfg",
+                                       run_dir + "/cache_config.cfg")
+            self.run_simulation(run_dir)
+            self.collect_stats(run_dir)
+
+    async def run_async(self):
+        if self.lookup():
+            return
+
+        with self.scratch_dir() as run_dir:
+            self.gen_cache_config_file(defs.ROOT_DIR + "/cacti/cache_template.cfg",
+                                       run_dir + "/cache_config.cfg")
+            await self.run_simulation_async(run_dir)
+            self.collect_stats(run_dir)
+
+    def collect_stats(self, run_dir):
+        # cacti reports some configuration errors without failing
+        if not os.path.exists(run_dir + "/results.csv"):
+            raise SimulationError(self.__class__.__name__, "cacti produced no results")
 
-        # Collect the statistics
-        self.stats = parse_csv(output_csv)
         fields = ["Area (mm2)", "Dynamic read energy (nJ)", "Dynamic write energy (nJ)"]
-        # Mcpat csv can store the restores of multiple runs.  So each field will
-        # have a list of values.  Only take the final value
-        last = len(self.stats[fields[0]]) - 1
-        self.stats = { key: self.stats[key][last] for key in fields }
+        self.stats = parse_csv(run_dir + "/results.csv", fields)
+        if len(self.stats) != len(fields):
+            raise SimulationError(self.__class__.__name__, "cacti results are incomplete")
 
 def main():
     sim = McPatSim({"cache_size" : 2048})
@@ -11,6 +11,18 @@ PROGRAM_LENGTH = 1000
 
 
 config_defaults = { "cpu_count": 1, "cpu_frequency": 9000, "cache_size": 1024}
+valid_sys_config_params = [ "cpu_count", "cpu_frequency", "cache_size"]
+
+def mock_formula(cpu_count, freq, cache_size):
+    """
+    Closed form mock stats.  Works on numbers as well as NumPy arrays.
+    """
+    stats = {}
+    stats["Area (mm2)"] = cache_size**2
+    stats["Dynamic read energy (nJ)"] = cache_size
+    stats["Dynamic write energy (nJ)"] = cache_size
+    stats["execution time (s)"] = ((PROGRAM_LENGTH)/(cpu_count*freq))*(1/cache_size)
+    return stats
 
 class MockSim(SimWrap):
     """
@@ -20,6 +32,10 @@ class MockSim(SimWrap):
         simulation results
     """
 
+    config_params = valid_sys_config_params
+    cost = 0
+    vectorized = True
+
     def __init__(self, sys_config):
         """
         Pass in dictionary of simulation parameters
@@ -37,23 +53,39 @@ class MockSim(SimWrap):
             self.config[k] = sys_config[k]
 
     def validate_params(self, sys_config):
-        valid_params = [ "cpu_count", "cpu_frequency", "cache_size"]
-        if not all(k in valid_params for k in sys_config.keys()):
+        if not all(k in valid_sys_config_params for k in sys_config.keys()):
             raise ValueError("Not a valid mock_sim config parameter")
 
+    def fingerprint(self):
+        return "length={0}".format(PROGRAM_LENGTH)
+
     def run_simulation(self):
         pass
 
     def mock_stats(self):
-        cpu_count = self.config["cpu_count"]
-        freq = self.config["cpu_frequency"]
-        cache_size = self.config["cache_size"]
-        stats = {}
-        stats["Area (mm2)"] = cache_size**2
-        stats["Dynamic read energy (nJ)"] = cache_size
-        stats["Dynamic write energy (nJ)"] = cache_size
-        stats["execution time (s)"] = ((PROGRAM_LENGTH)/(cpu_count*freq))*(1/cache_size)
-        self.stats = stats
+        self.stats = mock_formula(self.config["cpu_count"], self.config["cpu_frequency"],
+                                  self.config["cache_size"])
+
+    def batch_stats(self, columns):
+        """
+        Computes the stats of many configs at once.  columns is a dictionary
+        of config parameter -> NumPy array with one entry per config, and
+        parameters without a column take their default value.  Returns a
+        dictionary of stat name -> NumPy array.
+        """
+        import numpy as np
+
+        self.validate_params(columns)
+        n = len(next(iter(columns.values()))) if len(columns) > 0 else 1
+        params = {}
+        for k in valid_sys_config_params:
+            if k in columns:
+                # Floats, so cache_size**2 can't overflow
+                params[k] = np.asarray(columns[k], dtype = float)
+            else:
+                params[k] = np.full(n, float(config_defaults[k]))
+
+        return mock_formula(params["cpu_count"], params["cpu_frequency"], params["cache_size"])
 
     def run(self):
         """
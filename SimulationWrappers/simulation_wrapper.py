@@ -1,7 +1,87 @@
 #!/usr/bin/env python3
 
 from abc import ABCMeta, abstractmethod
+import asyncio
+from contextlib import contextmanager
+from enum import Enum
+import defs
+import hashlib
 import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+class Cleanup(Enum):
+    Always = 1
+    Keep_On_Failure = 2
+    Never = 3
+
+# (path, size, modification time) -> SHA-1 of the file contents
+_content_hashes = {}
+
+def content_hash(filename):
+    """
+    SHA-1 of the contents of a file.  Each version of a file (by size and
+    modification time) is only read once per process, since simulator
+    binaries are large.
+    """
+    st = os.stat(filename)
+    key = (filename, st.st_size, st.st_mtime_ns)
+    if not key in _content_hashes:
+        h = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                h.update(block)
+        _content_hashes[key] = h.hexdigest()
+
+    return _content_hashes[key]
+
+def file_fingerprint(*filenames):
+    """
+    Fingerprint of a set of files, based on their contents, so a rebuild or
+    a copy of the same binary keeps the fingerprint.  Missing files are
+    skipped.
+    """
+    h = hashlib.sha1()
+    for filename in filenames:
+        if os.path.exists(filename):
+            h.update("{0}:{1};".format(os.path.basename(filename), content_hash(filename)).encode())
+
+    return h.hexdigest()
+
+def resident_memory(pid):
+    """
+    Resident set size of a running process in bytes, from
+    /proc/<pid>/status, or None if it can't be read
+    """
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    return None
+
+class SimulationError(Exception):
+    """
+    Raised when a simulator fails to produce results for a config, i.e. its
+    program exits with an error, is killed or runs out of time.  stats holds
+    the results of the simulators that ran before it in the same pipeline.
+    """
+
+    def __init__(self, sim_name, reason):
+        super().__init__(sim_name, reason)
+        self.sim_name = sim_name
+        self.reason = reason
+        self.stats = {}
+
+    def __str__(self):
+        return "{0}: {1}".format(self.sim_name, self.reason)
 
 class SimWrap(metaclass=ABCMeta):
     """
@@ -9,8 +89,52 @@ class SimWrap(metaclass=ABCMeta):
         simulation configuration
     self.stats
         simulation results
+    config_params
+        The sys_config parameters the simulation results depend on, or None
+        if they depend on all of them
+    cost
+        Expected relative cost of one run.  Cheaper simulators run first so
+        constraint violations are caught before the expensive ones run.
+    filters_stats
+        Whether the simulator honours self.stat_filter, the set of stat names
+        its caller needs (None for all of them), and drops every other stat
+    monotonic_stats
+        Constraint name -> simulator stat that only grows during a run.  The
+        caller sets self.stat_bounds to the constraint name -> RangeString of
+        the upper bounds on them, so runs can stop once one is past its bound.
+    scratch_root
+        Directory in which each run gets its own scratch directory (e.g. a
+        tmpfs mount).  Defaults to defs.SCRATCH_DIR, or to
+        tempfile.gettempdir() if that is None.
+    cleanup
+        When scratch directories are removed after a run
+    timeout
+        Wall clock seconds after which a run is killed, or None
+    max_memory
+        Bytes of resident memory (RSS) a run may use, or None.  It is checked
+        every self.poll_interval seconds, and the run is killed once over.
+    retries
+        Number of times a failed run is retried before the config is given up
+    poll_interval
+        Wall clock seconds between checks on a running program
+    vectorized
+        Whether batch_stats() computes the stats of many configs at once
     """
 
+    config_params = None
+    cost = 1
+    filters_stats = False
+    stat_filter = None
+    monotonic_stats = {}
+    stat_bounds = None
+    scratch_root = None
+    cleanup = Cleanup.Keep_On_Failure
+    timeout = None
+    max_memory = None
+    retries = 0
+    poll_interval = 1.0
+    vectorized = False
+
     def __init__(self):
         """
         Pass in dictionary of simulation parameters
@@ -26,6 +150,179 @@ class SimWrap(metaclass=ABCMeta):
         Store statistics
         """
 
+    async def run_async(self):
+        """
+        Asynchronous version of run().  Simulators that run an external
+        program override this to await the program instead of blocking.
+        """
+        self.run()
+
+    def poll_timeout(self, deadline, watch):
+        timeouts = []
+        if watch is not None or self.max_memory is not None:
+            timeouts.append(self.poll_interval)
+        if deadline is not None:
+            timeouts.append(max(0, deadline - time.monotonic()))
+
+        return min(timeouts) if len(timeouts) > 0 else None
+
+    def check_poll(self, pid, deadline, watch):
+        """
+        Raises SimulationError once the deadline is past or process pid uses
+        more than self.max_memory.  Otherwise returns whether watch() asks to
+        stop the run.
+        """
+        if deadline is not None and time.monotonic() >= deadline:
+            raise SimulationError(self.__class__.__name__,
+                                  "timed out after {} s".format(self.timeout))
+
+        if self.max_memory is not None:
+            rss = resident_memory(pid)
+            if rss is not None and rss > self.max_memory:
+                raise SimulationError(self.__class__.__name__,
+                                      "used {0} bytes of memory, over the limit of {1}".format(rss, self.max_memory))
+
+        return watch is not None and watch()
+
+    def check_returncode(self, argv, returncode):
+        name = os.path.basename(argv[0])
+        if returncode < 0:
+            raise SimulationError(self.__class__.__name__,
+                                  "{0} killed by signal {1}".format(name, -returncode))
+        if returncode > 0:
+            raise SimulationError(self.__class__.__name__,
+                                  "{0} exited with status {1}".format(name, returncode))
+
+    def run_command(self, argv, run_dir, log, watch = None):
+        """
+        Runs an external program in run_dir, appending its output to log.
+        The program is killed once it runs for longer than self.timeout, or as
+        soon as its resident memory exceeds self.max_memory or watch()
+        returns True, both checked every self.poll_interval seconds.
+
+        Returns whether the program ran to completion.  Raises
+        SimulationError if it fails, times out or uses too much memory.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with open(log, "a") as f:
+            process = subprocess.Popen(argv, cwd = run_dir, stdout = f, stderr = subprocess.STDOUT)
+            try:
+                while True:
+                    try:
+                        returncode = process.wait(timeout = self.poll_timeout(deadline, watch))
+                        break
+                    except subprocess.TimeoutExpired:
+                        pass
+
+                    if self.check_poll(process.pid, deadline, watch):
+                        return False
+            finally:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+        self.check_returncode(argv, returncode)
+        return True
+
+    async def run_command_async(self, argv, run_dir, log, watch = None):
+        """
+        Same as run_command(), but awaits the program with asyncio
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with open(log, "a") as f:
+            process = await asyncio.create_subprocess_exec(*argv, cwd = run_dir, stdout = f,
+                                                           stderr = subprocess.STDOUT)
+            try:
+                while True:
+                    try:
+                        returncode = await asyncio.wait_for(process.wait(),
+                                                            self.poll_timeout(deadline, watch))
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+
+                    if self.check_poll(process.pid, deadline, watch):
+                        return False
+            finally:
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+
+        self.check_returncode(argv, returncode)
+        return True
+
+    @contextmanager
+    def scratch_dir(self):
+        """
+        Creates an isolated working directory for the inputs, outputs and logs
+        of one run, so simulations can run concurrently.  The directory is
+        removed afterwards according to self.cleanup.
+        """
+        root = self.scratch_root if self.scratch_root is not None else defs.SCRATCH_DIR
+        if root is None:
+            root = tempfile.gettempdir()
+        os.makedirs(root, exist_ok = True)
+        run_dir = tempfile.mkdtemp(prefix = self.__class__.__name__ + "-", dir = root)
+
+        failed = True
+        try:
+            yield run_dir
+            failed = False
+        finally:
+            if (self.cleanup == Cleanup.Always or
+                (self.cleanup == Cleanup.Keep_On_Failure and not failed)):
+                shutil.rmtree(run_dir, ignore_errors = True)
+            elif failed:
+                logging.warning("Keeping scratch directory of failed run: {}".format(run_dir))
+
+    def batch_stats(self, columns):
+        """
+        For vectorized simulators: computes the stats of many configs at once,
+        given a dictionary of config parameter -> NumPy array with one entry
+        per config.  Returns a dictionary of stat name -> NumPy array.
+        """
+        raise NotImplementedError("{} can't compute stats in batches".format(self.__class__.__name__))
+
+    def precompute(self, param_ranges, max_workers = 1):
+        """
+        Hook for simulators that can compute their results for the whole
+        search space up front, given the searcher's param_ranges, with up to
+        max_workers runs at once
+        """
+        pass
+
+    def project_config(self, sys_config):
+        """
+        Returns the part of sys_config the simulation results depend on.
+        Results can be reused for every sys_config with the same projection.
+        """
+        if self.config_params is None:
+            return dict(sys_config)
+
+        return dict((k, sys_config[k]) for k in self.config_params if k in sys_config)
+
+    def search_stats(self):
+        """
+        Returns the stats of the last run as recorded by the search state.
+        Simulators with a costly view of their stats (Gem5Sim) return a
+        cheaper form here, and build the view in output_stats().
+        """
+        return self.stats
+
+    def output_stats(self, stats):
+        """
+        Converts stats returned by search_stats() into the form they take in
+        the job output
+        """
+        return stats
+
+    def fingerprint(self):
+        """
+        Identifies the version of the simulator.  Stored results are only
+        reused by a simulator with the same fingerprint.
+        """
+        return ""
+
     def stats_to_json(self):
         """
         Outputs the stats of the simulation with the simulation class name as
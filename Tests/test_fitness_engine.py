@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import random
+import unittest
+import os
+import defs
+
+from DSE_search_state import MockSearchState, EmbeddedSearchState, BalancedSearchState
+from DSE_search_state import dict_to_key, eval_embedded, eval_balanced
+from fitness_engine import LinearFitness, feasible_mask, score_batch
+from range_string import RangeString
+from test_utils import log_name
+
+default_benchmark = defs.ROOT_DIR + "/Tests/test-progs/random_access/random_access"
+default_options = "10000"
+
+features = ["Area (mm2)", "Dynamic read energy (nJ)", "Dynamic write energy (nJ)", "execution time (s)"]
+
+def random_stats():
+    return {"Area (mm2)": random.uniform(0, 1e7),
+            "Dynamic read energy (nJ)": random.uniform(0, 3e3),
+            "Dynamic write energy (nJ)": random.uniform(0, 3e3),
+            "execution time (s)": random.uniform(0, 3e-10)}
+
+class TestFitnessEngine(unittest.TestCase):
+    @log_name
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            LinearFitness(["a", "b"], [0, 0], [1], [1, 1])
+        with self.assertRaises(ValueError):
+            LinearFitness(["a"], [0], [0], [1])
+
+    @log_name
+    def test_profile(self):
+        stats = random_stats()
+        m = [4.7721E6, 1.7763E3, 1.7763E3, 1.0427E-10]
+        s = [1.0044E7, 1.2847E3, 1.2847E3, 1.2395E-10]
+        w = [2, 1, 1, 10]
+        expected = sum((stats[features[i]] - m[i]) / s[i] * w[i] for i in range(4))
+        self.assertAlmostEqual(eval_embedded(stats), expected)
+        self.assertEqual(eval_embedded.required_stats, tuple(features))
+
+    @log_name
+    def test_score_batch(self):
+        """
+        Batch scores match scoring each row on its own
+        """
+        rows = [random_stats() for _ in range(100)]
+        scores = eval_balanced.score_batch(rows)
+        for (row, score) in zip(rows, scores):
+            self.assertAlmostEqual(score, eval_balanced(row), places = 6)
+
+        # Plain functions are scored row by row
+        scores = score_batch(lambda stats: stats["Area (mm2)"], {}, rows)
+        self.assertEqual(scores.tolist(), [row["Area (mm2)"] for row in rows])
+
+    @log_name
+    def test_constraints(self):
+        """
+        Rows violating a constraint score inf, and constraints on missing
+        stats are not checked
+        """
+        constraints = {"Area (mm2)": RangeString("(-inf, 2]"),
+                       "execution time (s)": RangeString("(0, 1]")}
+        rows = [{"Area (mm2)": 1.0, "execution time (s)": 0.5},
+                {"Area (mm2)": 3.0, "execution time (s)": 0.5},
+                {"Area (mm2)": 2.0, "execution time (s)": 0.0},
+                {"Area (mm2)": 2.0}]
+        self.assertEqual(feasible_mask(constraints, rows).tolist(), [True, False, False, True])
+
+        fitness = LinearFitness(["Area (mm2)"], [0], [1], [1])
+        self.assertEqual(score_batch(fitness, constraints, rows).tolist(),
+                         [1.0, float("inf"), float("inf"), 2.0])
+
+    @log_name
+    def test_rescore(self):
+        """
+        Recorded configs rescored under another profile match a search run
+        with that profile
+        """
+        C = { "Area (mm2)": "(-inf, 4e9]" }
+        embedded = EmbeddedSearchState(C, {}, default_benchmark, default_options)
+        balanced = BalancedSearchState(C, {}, default_benchmark, default_options)
+
+        sys_configs = [{"cache_size": 2**i, "cpu_frequency" : 7e9, "cpu_count" : 7} for i in range(10, 20)]
+        embedded_fitnesses = [embedded.eval_fitness(c) for c in sys_configs]
+        balanced_fitnesses = [balanced.eval_fitness(c) for c in sys_configs]
+        self.assertTrue(float("inf") in balanced_fitnesses)
+
+        rescored = embedded.rescore(eval_balanced)
+        for (sys_config, fitness) in zip(sys_configs, balanced_fitnesses):
+            self.assertAlmostEqual(rescored[dict_to_key(sys_config)], fitness)
+
+        rescored = embedded.rescore()
+        for (sys_config, fitness) in zip(sys_configs, embedded_fitnesses):
+            self.assertAlmostEqual(rescored[dict_to_key(sys_config)], fitness)
+
+        # Configs recorded after a rescore are picked up by the next one
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 1e9, "cpu_count" : 1}
+        fitness = balanced.eval_fitness(sys_config)
+        embedded.eval_fitness(sys_config)
+        self.assertAlmostEqual(embedded.rescore(eval_balanced)[dict_to_key(sys_config)], fitness)
+        self.assertEqual(len(embedded.stats_table), len(sys_configs) + 1)
+
+if __name__ == '__main__':
+    script_name = os.path.basename(__file__)
+    script_name = script_name.split(".")[0]
+    logging.basicConfig(filename = defs.LOG_DIR + '/{}.log'.format(script_name),  level = logging.INFO)
+    logging.info("START {} TESTS: {:%Y-%m-%d %H:%M:%S}".format(script_name, datetime.datetime.now()))
+    unittest.main()
+    logging.info("END {} TESTS".format(script_name))
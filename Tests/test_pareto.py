@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import math
+import unittest
+import os
+import defs
+
+import numpy as np
+
+from pareto import crowding_distance, dominance_matrix, non_dominated_sort, pareto_mask
+from test_utils import log_name
+
+class TestPareto(unittest.TestCase):
+    @log_name
+    def test_non_dominated_sort(self):
+        F = np.array([[1, 4], [2, 2], [4, 1], [3, 3], [4, 4], [math.inf, math.inf]])
+        self.assertEqual(non_dominated_sort(F), [[0, 1, 2], [3], [4], [5]])
+
+        D = dominance_matrix(F)
+        self.assertTrue(D[1, 3])
+        self.assertFalse(D[3, 1])
+        self.assertFalse(np.any(np.diag(D)))
+
+    @log_name
+    def test_pareto_mask(self):
+        """
+        Culling finds the same first front as the full sort, duplicates
+        included
+        """
+        rng = np.random.RandomState(0)
+        F = np.vstack((rng.randint(0, 10, (200, 3)), [[0, 0, 9], [0, 0, 9]]))
+        front = non_dominated_sort(F)[0]
+        self.assertEqual(np.flatnonzero(pareto_mask(F)).tolist(), sorted(front))
+        self.assertTrue(pareto_mask(F)[-1] and pareto_mask(F)[-2])
+
+    @log_name
+    def test_crowding_distance(self):
+        F = np.array([[0.0, 4.0], [1.0, 3.0], [3.0, 1.0], [4.0, 0.0]])
+        distance = crowding_distance(F)
+        self.assertEqual(distance[0], math.inf)
+        self.assertEqual(distance[3], math.inf)
+        self.assertAlmostEqual(distance[1], 1.5)
+        self.assertAlmostEqual(distance[2], 1.5)
+        self.assertTrue(np.all(crowding_distance(F[:2]) == math.inf))
+
+if __name__ == '__main__':
+    script_name = os.path.basename(__file__)
+    script_name = script_name.split(".")[0]
+    logging.basicConfig(filename = defs.LOG_DIR + '/{}.log'.format(script_name),  level = logging.INFO)
+    logging.info("START {} TESTS: {:%Y-%m-%d %H:%M:%S}".format(script_name, datetime.datetime.now()))
+    unittest.main()
+    logging.info("END {} TESTS".format(script_name))
@@ -55,6 +55,55 @@ class TestRangeString(unittest.TestCase):
             for test_case in test_not_within[test_string]:
                 self.assertFalse(rs.in_range(test_case))
 
+    @log_name
+    def test_str(self):
+        for test_string in ["(-inf, inf)", "(-inf, 0.0]", "[-1.0, 1.0)", "[1.0, 1.0]"]:
+            self.assertEqual(str(RangeString(test_string)), test_string)
+
+    @log_name
+    def test_mask(self):
+        import numpy as np
+
+        values = np.array([-5000, -1.0, -0.5, 0.0, 1.0, 1.0001, float("inf")])
+        for test_string in ["(-inf, inf)", "(-inf, 0]", "(-1, 1]", "[1.0, inf)"]:
+            rs = RangeString(test_string)
+            self.assertEqual(rs.mask(values).tolist(), [rs.in_range(f) for f in values])
+
+    @log_name
+    def test_above(self):
+        rs = RangeString("(-inf, 1.0]")
+        self.assertFalse(rs.above(1.0))
+        self.assertTrue(rs.above(1.5))
+        rs = RangeString("[0.0, 1.0)")
+        self.assertFalse(rs.above(-1.0))
+        self.assertTrue(rs.above(1.0))
+
+    @log_name
+    def test_monotonic(self):
+        rs = RangeString("[0.0, 1.0)")
+        self.assertTrue(rs.below(-1.0))
+        self.assertFalse(rs.below(0.0))
+        self.assertEqual(rs.monotonic, {})
+
+        with self.assertRaises(ValueError):
+            RangeString("[0.0, 1.0)", {"cache_size": "up"})
+
+        rs = RangeString("(-inf, 1.0]", {"cache_size": "increasing", "cpu_count": "independent",
+                                         "cpu_frequency": "decreasing"})
+        violating = {"cache_size": 8, "cpu_count": 2, "cpu_frequency": 2, "other": 1}
+        self.assertTrue(rs.implies_violation(violating, violating, True))
+        self.assertTrue(rs.implies_violation(violating,
+                        {"cache_size": 16, "cpu_count": 1, "cpu_frequency": 1, "other": 1}, True))
+        self.assertFalse(rs.implies_violation(violating,
+                         {"cache_size": 4, "cpu_count": 2, "cpu_frequency": 2, "other": 1}, True))
+        self.assertFalse(rs.implies_violation(violating,
+                         {"cache_size": 8, "cpu_count": 2, "cpu_frequency": 4, "other": 1}, True))
+        self.assertFalse(rs.implies_violation(violating,
+                         {"cache_size": 8, "cpu_count": 2, "cpu_frequency": 2, "other": 2}, True))
+        # Short of the lower end, the directions flip
+        self.assertTrue(rs.implies_violation(violating,
+                        {"cache_size": 4, "cpu_count": 8, "cpu_frequency": 4, "other": 1}, False))
+
 if __name__ == '__main__':
     script_name = os.path.basename(__file__)
     script_name = script_name.split(".")[0]
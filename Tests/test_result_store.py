@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import unittest
+import os
+import tempfile
+import defs
+
+from concurrent.futures import ProcessPoolExecutor
+from DSE_search_state import MockSearchState
+from mock_sim import MockSim
+from result_store import ResultStore
+from simulation_wrapper import file_fingerprint
+from test_utils import log_name
+
+default_benchmark = defs.ROOT_DIR + "/Tests/test-progs/random_access/random_access"
+default_options = "1000"
+
+def put_result(filename, cache_size):
+    store = ResultStore(filename)
+    sim = MockSim({"cache_size" : cache_size})
+    sim.run()
+    store.put(sim, sim.config, default_benchmark, default_options, sim.stats)
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.filename = self.tmp_dir.name + "/results.db"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @log_name
+    def test_put_get(self):
+        store = ResultStore(self.filename)
+        sim = MockSim({"cache_size" : 2048})
+        sim.run()
+
+        self.assertEqual(store.get(sim, sim.config, default_benchmark, default_options), None)
+        store.put(sim, sim.config, default_benchmark, default_options, sim.stats)
+        self.assertEqual(store.get(sim, sim.config, default_benchmark, default_options), sim.stats)
+
+        # Integral floats and ints name the same config
+        config = dict(sim.config)
+        config["cpu_frequency"] = float(config["cpu_frequency"])
+        self.assertEqual(store.get(sim, config, default_benchmark, default_options), sim.stats)
+
+        # Any other benchmark, options or simulator version is a miss
+        self.assertEqual(store.get(sim, sim.config, default_benchmark, "10"), None)
+        self.assertEqual(store.get(sim, sim.config, "other", default_options), None)
+        sim.fingerprint = lambda: "new version"
+        self.assertEqual(store.get(sim, sim.config, default_benchmark, default_options), None)
+
+        # The store outlives the object that wrote it
+        self.assertNotEqual(ResultStore(self.filename).get(MockSim(sim.config), sim.config,
+                            default_benchmark, default_options), None)
+
+    @log_name
+    def test_shared_across_search_states(self):
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7}
+
+        first = MockSearchState({}, {}, default_benchmark, default_options)
+        first.result_store = ResultStore(self.filename)
+        expected = first.eval_fitness(sys_config)
+
+        def fail():
+            raise ValueError("Simulation should have come from the result store")
+
+        second = MockSearchState({}, {}, default_benchmark, default_options)
+        second.result_store = ResultStore(self.filename)
+        second.sims[0].run = fail
+        self.assertEqual(second.eval_fitness(sys_config), expected)
+        self.assertEqual(first.stats, second.stats)
+
+    @log_name
+    def test_concurrent_writers(self):
+        cache_sizes = [2**i for i in range(10, 26)]
+        with ProcessPoolExecutor(max_workers = 4) as executor:
+            list(executor.map(put_result, [self.filename] * len(cache_sizes), cache_sizes))
+
+        store = ResultStore(self.filename)
+        for cache_size in cache_sizes:
+            sim = MockSim({"cache_size" : cache_size})
+            self.assertNotEqual(store.get(sim, sim.config, default_benchmark, default_options), None)
+
+    @log_name
+    def test_file_fingerprint(self):
+        """
+        Fingerprints follow the contents of the simulator binary, not where
+        it is or when it was built
+        """
+        with tempfile.TemporaryDirectory() as a, tempfile.TemporaryDirectory() as b:
+            for directory in [a, b]:
+                with open(directory + "/gem5.opt", "wb") as f:
+                    f.write(b"version 1")
+            self.assertEqual(file_fingerprint(a + "/gem5.opt"), file_fingerprint(b + "/gem5.opt"))
+
+            with open(b + "/gem5.opt", "wb") as f:
+                f.write(b"version 2")
+            os.utime(b + "/gem5.opt", ns = (0, 10**9))
+            self.assertNotEqual(file_fingerprint(a + "/gem5.opt"), file_fingerprint(b + "/gem5.opt"))
+            self.assertEqual(file_fingerprint(a + "/missing"), file_fingerprint())
+
+if __name__ == '__main__':
+    script_name = os.path.basename(__file__)
+    script_name = script_name.split(".")[0]
+    logging.basicConfig(filename=defs.LOG_DIR + '/{}.log'.format(script_name), level=logging.INFO)
+    logging.info("START {} TESTS: {:%Y-%m-%d %H:%M:%S}".format(script_name, datetime.datetime.now()))
+    unittest.main()
+    logging.info("END {} TESTS".format(script_name))
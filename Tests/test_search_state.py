@@ -1,18 +1,56 @@
 #!/usr/bin/env python3
 
 
+import asyncio
 import datetime
+import json
 import logging
 import unittest
 import os
+import re
 import defs
 
-from DSE_search_state import MockSearchState
+from concurrent.futures import ProcessPoolExecutor
+from DSE_search_state import MockSearchState, dict_to_key, uses_stats
+from DSE_search_state import McPatSearchState
+from gem5_sim import Gem5Sim
+from test_sim_wrappers import sample_stats
+from mcpat_sim import McPatSim
+from mock_sim import MockSim
+from range_string import RangeString
+from simulation_wrapper import Cleanup
 from test_utils import log_name
 
 default_benchmark = defs.ROOT_DIR + "/Test/test-progs/random_access/random_access"
 default_options = "10000"
 
+class FailingSim(MockSim):
+    """
+    Fails on caches smaller than 4 kB
+    """
+    config_params = ["cache_size"]
+    cleanup = Cleanup.Always
+    retries = 1
+
+    def run(self):
+        if self.config["cache_size"] < 4096:
+            self.attempts = getattr(self, "attempts", 0) + 1
+            with self.scratch_dir() as run_dir:
+                self.run_command(["false"], run_dir, run_dir + "/false.log")
+        super().run()
+
+class SizedSim(MockSim):
+    """
+    Takes benchmark options like Gem5Sim: the execution time scales with the
+    input size
+    """
+    options = "1"
+
+    def run(self):
+        super().run()
+        self.stats["execution time (s)"] *= int(self.options)
+        self.runs = getattr(self, "runs", 0) + 1
+
 class TestSearchState(unittest.TestCase):
     @log_name
     def test_defaults(self):
@@ -88,6 +126,343 @@ class TestSearchState(unittest.TestCase):
 
         self.assertTrue(expected_fitness, fitness)
 
+    @log_name
+    def test_eval_fitness_batch(self):
+        sys_configs = [{"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7},
+                       {"cache_size": 2048, "cpu_frequency" : 7e9, "cpu_count" : 7},
+                       {"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7}]
+
+        serial = MockSearchState({}, {}, default_benchmark, default_options)
+        expected = [serial.eval_fitness(c) for c in sys_configs]
+
+        mock = MockSearchState({}, {}, default_benchmark, default_options)
+        with ProcessPoolExecutor(max_workers = 2) as executor:
+            fitnesses = mock.eval_fitness_batch(sys_configs, executor)
+
+        self.assertEqual(expected, fitnesses)
+        self.assertEqual(serial.stats, mock.stats)
+
+    @log_name
+    def test_shared_pending_simulations(self):
+        """
+        Configs already in flight are not dispatched a second time
+        """
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7}
+        mock = MockSearchState({}, {}, default_benchmark, default_options)
+        with ProcessPoolExecutor(max_workers = 2) as executor:
+            first = mock.submit([sys_config], executor)
+            second = mock.submit([sys_config, dict(sys_config)], executor)
+            self.assertEqual(len(first), 1)
+            self.assertTrue(all(f is first[0] for f in second))
+
+            mock.eval_fitness(sys_config)
+            self.assertEqual(mock.submit([sys_config], executor), [])
+
+    @log_name
+    def test_projected_memoization(self):
+        """
+        Simulators only rerun when the parameters they depend on change
+        """
+        mock = McPatSearchState({}, default_benchmark, default_options)
+        sim = mock.sims[0]
+        runs = []
+        def fake_run():
+            runs.append(sim.config["cache_size"])
+            sim.stats = {"Area (mm2)": 1.0,
+                         "Dynamic read energy (nJ)": 1.0,
+                         "Dynamic write energy (nJ)": 1.0}
+        sim.run = fake_run
+
+        for cpu_count in range(1, 9):
+            for cache_size in [1024, 2048]:
+                mock.eval_fitness({"cache_size": cache_size, "cpu_frequency" : 7e9, "cpu_count" : cpu_count})
+
+        self.assertEqual(runs, [1024, 2048])
+        self.assertEqual(len(mock.stats), 16)
+
+    @log_name
+    def test_precomputed_table(self):
+        """
+        McPAT results are computed up front for the whole cache_size range,
+        and the search only looks them up
+        """
+        mock = McPatSearchState({}, default_benchmark, default_options)
+        sim = mock.sims[0]
+        runs = []
+        def fake_simulation(run_dir):
+            with open(run_dir + "/cache_config.cfg") as f:
+                cache_size = re.search(r"^-size \(bytes\) (\d+)", f.read(), re.M).group(1)
+            runs.append(int(cache_size))
+            with open(run_dir + "/results.csv", "w") as f:
+                f.write("Area (mm2), Dynamic read energy (nJ), Dynamic write energy (nJ),\n")
+                f.write("{0}, 1.0, 1.0,\n".format(cache_size))
+        sim.run_simulation = fake_simulation
+
+        cache_sizes = [2**i for i in range(10, 16)]
+        mock.precompute({"cache_size": cache_sizes, "cpu_count": [1, 2]}, 4)
+        self.assertEqual(sorted(runs), cache_sizes)
+        self.assertEqual(sorted(sim.table.keys()), cache_sizes)
+
+        for cache_size in cache_sizes:
+            mock.eval_fitness({"cache_size": cache_size, "cpu_frequency" : 7e9, "cpu_count" : 1})
+            self.assertEqual(float(sim.stats["Area (mm2)"]), cache_size)
+        self.assertEqual(len(runs), len(cache_sizes))
+
+    @log_name
+    def test_staged_evaluation(self):
+        """
+        Expensive simulators are skipped once a cheaper one violates a
+        constraint
+        """
+        C = { "Area (mm2)": "(-inf, 2]" }
+        mock = MockSearchState(C, {}, default_benchmark, default_options)
+
+        gem5 = Gem5Sim(default_benchmark, default_options)
+        def fail():
+            raise ValueError("gem5 should have been skipped")
+        gem5.run = fail
+
+        mcpat = McPatSim()
+        def fake_run():
+            mcpat.stats = {"Area (mm2)": 3.0,
+                           "Dynamic read energy (nJ)": 1.0,
+                           "Dynamic write energy (nJ)": 1.0}
+        mcpat.run = fake_run
+
+        mock.sims = [gem5, mcpat]
+
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7}
+        self.assertEqual(mock.eval_fitness(sys_config), float("inf"))
+        self.assertEqual(mock.pruned[dict_to_key(sys_config)],
+                         {"violated_constraints": ["Area (mm2)"],
+                          "skipped_simulations": ["Gem5Sim"]})
+
+        output = json.loads(mock.generate_job_output([sys_config]))
+        self.assertEqual(output["constraints"], {"Area (mm2)": "(-inf, 2.0]"})
+        self.assertEqual(output["search_parties"][0]["pruned"]["skipped_simulations"], ["Gem5Sim"])
+
+        # A config sharing the violating McPAT results is pruned without
+        # running anything
+        mcpat.run = fail
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 1e9, "cpu_count" : 1}
+        self.assertEqual(mock.eval_fitness(sys_config), float("inf"))
+
+    @log_name
+    def test_stat_pushdown(self):
+        """
+        gem5 only keeps the stats the fitness function and constraints read,
+        unless full stats are requested for the final configs
+        """
+        @uses_stats("sim_seconds")
+        def fitness(stats):
+            return stats["sim_seconds"]
+
+        C = { "sim_ticks": "(0, inf)" }
+        mock = MockSearchState(C, {}, default_benchmark, default_options, fitness)
+        gem5 = Gem5Sim(default_benchmark, default_options)
+        def fake_simulation(run_dir):
+            with open(run_dir + "/stats.txt", "w") as f:
+                f.write(sample_stats)
+        gem5.run_simulation = fake_simulation
+        mock.sims = [gem5]
+
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7}
+        self.assertEqual(mock.required_stats(), set(["sim_seconds", "sim_ticks"]))
+        self.assertEqual(mock.eval_fitness(sys_config), 0.000219)
+        self.assertEqual(mock.stats[dict_to_key(sys_config)]["Gem5Sim"],
+                         {"sim_seconds": 0.000219, "sim_ticks": 219000000})
+
+        output = json.loads(mock.generate_job_output([sys_config]))
+        self.assertFalse("system" in output["search_parties"][0]["simulation_results"]["Gem5Sim"])
+
+        mock.full_final_stats = True
+        output = json.loads(mock.generate_job_output([sys_config]))
+        self.assertTrue("system" in output["search_parties"][0]["simulation_results"]["Gem5Sim"])
+
+    @log_name
+    def test_streaming_abort(self):
+        """
+        gem5 is stopped once its periodic stat dumps go past an execution
+        time bound, and the config is infeasible
+        """
+        # Stands in for gem5: one dump every 50ms, 0.1ms of simulated time
+        # apart, each also logged to a file outside the scratch directory
+        program = ("import sys, time\n"
+                   "for i in range(1, 100):\n"
+                   "    with open('stats.txt', 'a') as f:\n"
+                   "        f.write(sys.argv[1].replace('0.000219', str(i * 1e-4)))\n"
+                   "    with open(sys.argv[2], 'a') as f:\n"
+                   "        f.write('dump\\n')\n"
+                   "    time.sleep(0.05)\n")
+        dump_log = defs.LOG_DIR + "/streaming_abort_dumps.log"
+        if os.path.exists(dump_log):
+            os.remove(dump_log)
+
+        C = { "execution time (s)": "(-inf, 0.0005]" }
+        mock = MockSearchState(C, {}, default_benchmark, default_options)
+        gem5 = Gem5Sim(default_benchmark, default_options)
+        gem5.poll_interval = 0.05
+        gem5.simulation_argv = lambda run_dir: ["python3", "-c", program, sample_stats, dump_log]
+        mock.sims = [gem5]
+
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7}
+        self.assertEqual(mock.eval_fitness(sys_config), float("inf"))
+
+        stats = mock.stats[dict_to_key(sys_config)]["Gem5Sim"]
+        self.assertGreater(stats["execution time (s)"], 0.0005)
+        self.assertEqual(stats["execution time (s)"], stats["sim_seconds"])
+        self.assertEqual(list(gem5.aborted.keys()), ["execution time (s)"])
+
+        # Killed soon after the bound, far from its 99 dumps
+        with open(dump_log) as f:
+            dumps = len(f.readlines())
+        self.assertGreaterEqual(dumps, 6)
+        self.assertLess(dumps, 50)
+
+    @log_name
+    def test_failed_simulations(self):
+        """
+        Failed runs are retried, then the config is infeasible and never run
+        again, along with every config sharing the failed projection
+        """
+        mock = MockSearchState({}, {}, default_benchmark, default_options)
+        sim = FailingSim({})
+        mock.sims = [sim]
+
+        sys_config = {"cache_size": 1024, "cpu_frequency" : 7e9, "cpu_count" : 7}
+        self.assertEqual(mock.eval_fitness(sys_config), float("inf"))
+        self.assertEqual(sim.attempts, 2)
+        self.assertEqual(mock.pruned[dict_to_key(sys_config)]["failed_simulations"],
+                         {"FailingSim": "false exited with status 1"})
+
+        shared = {"cache_size": 1024, "cpu_frequency" : 1e9, "cpu_count" : 1}
+        self.assertEqual(mock.eval_fitness(shared), float("inf"))
+        self.assertEqual(sim.attempts, 2)
+
+        sys_configs = [{"cache_size": 2**i, "cpu_frequency" : 7e9, "cpu_count" : 7} for i in range(11, 14)]
+        with ProcessPoolExecutor(max_workers = 2) as executor:
+            fitnesses = mock.eval_fitness_batch(sys_configs, executor)
+        self.assertEqual(fitnesses[0], float("inf"))
+        self.assertTrue(all(f != float("inf") for f in fitnesses[1:]))
+
+        output = json.loads(mock.generate_job_output([sys_configs[0]]))
+        self.assertEqual(output["search_parties"][0]["pruned"]["skipped_simulations"], ["FailingSim"])
+
+    @log_name
+    def test_eval_fitness_async(self):
+        """
+        Simulations awaited concurrently give the same results, and run at
+        the same time up to the limit
+        """
+        class SleepSim(MockSim):
+            # Shared by the copies of the simulator each run gets
+            running = [0]
+            peak = [0]
+
+            async def run_async(self):
+                self.running[0] += 1
+                self.peak[0] = max(self.peak[0], self.running[0])
+                try:
+                    with self.scratch_dir() as run_dir:
+                        await self.run_command_async(["sleep", "0.2"], run_dir, run_dir + "/sleep.log")
+                finally:
+                    self.running[0] -= 1
+                self.run()
+
+        sys_configs = [{"cache_size": 2**i, "cpu_frequency" : 7e9, "cpu_count" : 7} for i in range(10, 20)]
+
+        serial = MockSearchState({}, {}, default_benchmark, default_options)
+        expected = [serial.eval_fitness(c) for c in sys_configs]
+
+        mock = MockSearchState({}, {}, default_benchmark, default_options)
+        mock.sims = [SleepSim({})]
+        fitnesses = asyncio.run(mock.eval_fitness_async(sys_configs + sys_configs[:2], 4))
+
+        # The runs overlapped, but never more than max_concurrent of them
+        self.assertGreater(SleepSim.peak[0], 1)
+        self.assertLessEqual(SleepSim.peak[0], 4)
+        self.assertEqual(SleepSim.running[0], 0)
+        self.assertEqual(fitnesses, expected + expected[:2])
+        self.assertEqual(len(mock.stats), len(sys_configs))
+
+    @log_name
+    def test_implied_violations(self):
+        """
+        Once a config violates a constraint with monotonicity hints, the
+        configs it implies violate it too are pruned without simulating
+        """
+        area = RangeString("(-inf, 1.6e7]", {"cache_size": "increasing", "cpu_count": "independent",
+                                             "cpu_frequency": "independent"})
+        mock = MockSearchState({"Area (mm2)": area}, {}, default_benchmark, default_options)
+
+        sys_config = {"cache_size": 2**13, "cpu_frequency" : 2e9, "cpu_count" : 2}
+        self.assertEqual(mock.eval_fitness(sys_config), float("inf"))
+        self.assertEqual(mock.simulations, 1)
+
+        larger = {"cache_size": 2**15, "cpu_frequency" : 7e9, "cpu_count" : 1}
+        self.assertEqual(mock.implied_violations(larger), ["Area (mm2)"])
+        self.assertEqual(mock.eval_fitness(larger), float("inf"))
+        self.assertEqual(mock.simulations, 1)
+        self.assertEqual(mock.pruned[dict_to_key(larger)]["implied_violations"], ["Area (mm2)"])
+        self.assertEqual(mock.pruned[dict_to_key(larger)]["skipped_simulations"], ["MockSim"])
+
+        smaller = {"cache_size": 2**11, "cpu_frequency" : 2e9, "cpu_count" : 2}
+        self.assertNotEqual(mock.eval_fitness(smaller), float("inf"))
+        self.assertEqual(mock.simulations, 2)
+
+        # Only the configs on the frontier are kept
+        mock.eval_fitness({"cache_size": 2**12, "cpu_frequency" : 1e9, "cpu_count" : 8})
+        self.assertEqual(mock.violations["Area (mm2)"],
+                         [(True, {"cache_size": 2**12, "cpu_frequency" : 1e9, "cpu_count" : 8})])
+
+    @log_name
+    def test_flat_stats_output(self):
+        """
+        gem5 stats are recorded flat, and only nested for the job output
+        """
+        sim = Gem5Sim(default_benchmark, default_options)
+        sim.flat_stats = {"sim_seconds": 0.1, "system.cpu.ipc": 1.5}
+        self.assertIs(sim.search_stats(), sim.flat_stats)
+        self.assertIsNone(sim.nested_stats)
+
+        mock = MockSearchState({}, {}, default_benchmark, default_options)
+        mock.sims.append(sim)
+        sys_config = {"cache_size": 2**12, "cpu_frequency" : 2e9, "cpu_count" : 2}
+        mock.stats[dict_to_key(sys_config)] = {"MockSim": {"Area (mm2)": 1}, "Gem5Sim": sim.search_stats()}
+
+        output = json.loads(mock.generate_job_output([sys_config]))
+        self.assertEqual(output["search_parties"][0]["simulation_results"]["Gem5Sim"],
+                         {"sim_seconds": 0.1, "system": {"cpu": {"ipc": 1.5}}})
+        self.assertEqual(json.loads(mock.stats_to_json(sys_config))["MockSim"], {"Area (mm2)": 1})
+        self.assertEqual(mock.stats[dict_to_key(sys_config)]["Gem5Sim"]["system.cpu.ipc"], 1.5)
+
+    @log_name
+    def test_set_options(self):
+        """
+        Each benchmark options string keeps its own results, and switching
+        back restores them without running the simulators again
+        """
+        mock = MockSearchState({}, {}, default_benchmark, "10")
+        sized = SizedSim({})
+        sized.options = "10"
+        mock.sims = [MockSim({}), sized]
+
+        sys_config = {"cache_size": 2**12, "cpu_frequency" : 2e9, "cpu_count" : 2}
+        small = mock.eval_fitness(sys_config)
+        small_time = mock.merged_stats(sys_config)["execution time (s)"]
+
+        mock.set_options("1000")
+        self.assertEqual(sized.options, "1000")
+        self.assertEqual(len(mock.stats), 0)
+        self.assertNotEqual(mock.eval_fitness(sys_config), small)
+        self.assertAlmostEqual(mock.merged_stats(sys_config)["execution time (s)"], 100 * small_time)
+        self.assertEqual(sized.runs, 2)
+
+        mock.set_options("10")
+        self.assertEqual(mock.eval_fitness(sys_config), small)
+        self.assertEqual(sized.runs, 2)
+        self.assertIn("MockSim", mock.sim_stats)
+
 if __name__ == '__main__':
     script_name = os.path.basename(__file__)
     script_name = script_name.split(".")[0]
@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
 
+import copy
 import datetime
+import itertools as it
+import json
 import logging
+import math
+import random as r
+import time
 import unittest
 import os
 import defs
 
 from DSE_searcher import DSE_searcher
 from DSE_searcher import Search_Algorithm
+from DSE_searcher import Seeding
+from DSE_searcher import index_dist
+from DSE_searcher import default_param_ranges
 from DSE_search_state import *
 from mock_sim import MockSim
+from range_string import RangeString
 from test_utils import log_name
 
 default_benchmark = defs.ROOT_DIR + "/Tests/test-progs/random_access/random_access"
@@ -65,6 +75,41 @@ class TestSearcher(unittest.TestCase):
         with self.assertRaises(ValueError):
             s = DSE_searcher(param_ranges = [1,2,3])
 
+        with self.assertRaises(ValueError):
+            s = DSE_searcher({}, num_workers = 0)
+
+    @log_name
+    def test_parallel_workers(self):
+        start = [{"cache_size": 2**16, "cpu_frequency" : 1e9, "cpu_count" : 1}]
+
+        serial = DSE_searcher({})
+        serial.sys_configs = copy.deepcopy(start)
+        serial_state = MockSearchState({}, {}, default_benchmark, default_options)
+        serial.search(serial_state)
+
+        parallel = DSE_searcher({}, num_workers = 4)
+        parallel.sys_configs = copy.deepcopy(start)
+        parallel_state = MockSearchState({}, {}, default_benchmark, default_options)
+        parallel.search(parallel_state)
+
+        self.assertEqual(serial.fitness_vals, parallel.fitness_vals)
+        # Results from the workers are recorded in the parent's search state
+        for sys_config in parallel.sys_configs:
+            self.assertTrue(dict_to_key(sys_config) in parallel_state.stats)
+        generate_job_output(parallel.sys_configs, parallel_state)
+
+    @log_name
+    def test_concurrent_parties(self):
+        s = DSE_searcher({}, num_search_parties = 4, concurrent_parties = True)
+        search_state = MockSearchState({}, {}, default_benchmark, default_options)
+        s.search(search_state)
+
+        self.assertEqual(len(s.sys_configs), 4)
+        for sys_config, fitness in zip(s.sys_configs, s.fitness_vals):
+            self.assertEqual(search_state.eval_fitness(sys_config), fitness)
+        self.assertEqual(search_state.pending, {})
+        generate_job_output(s.sys_configs, search_state)
+
     # TODO: fix stat_output for multiple search parties
     @log_name
     def test_stat_output(self):
@@ -80,6 +125,25 @@ class TestSearcher(unittest.TestCase):
         search_state = MockSearchState({}, {}, default_benchmark, default_options)
         s.search(search_state)
 
+    @log_name
+    def test_latin_hypercube_seeding(self):
+        s = DSE_searcher({}, num_search_parties = 16, seeding = Seeding.Latin_Hypercube,
+                         min_seed_dist = 3)
+        self.assertEqual(len(s.sys_configs), 16)
+
+        seeds = [s.config_to_index(c) for c in s.sys_configs]
+        for i in range(len(seeds)):
+            for j in range(i + 1, len(seeds)):
+                self.assertTrue(index_dist(seeds[i], seeds[j]) >= 3)
+
+        search_state = MockSearchState({}, {}, default_benchmark, default_options)
+        s.search(search_state)
+
+        # Impossible to place more seeds than there are configs
+        small_ranges = {"cpu_count" : [1, 2], "cpu_frequency" : [10**9], "cache_size" : [2**11]}
+        with self.assertRaises(ValueError):
+            DSE_searcher(small_ranges, num_search_parties = 3, seeding = Seeding.Latin_Hypercube)
+
     @log_name
     def test_A_star(self):
         modified_param_ranges = {
@@ -90,6 +154,357 @@ class TestSearcher(unittest.TestCase):
         s = DSE_searcher(modified_param_ranges, num_search_parties=1)
         s.algorithm = Search_Algorithm.A_Star
         search_state = MockSearchState({}, {}, default_benchmark, default_options)
+        s.search(search_state)
+
+        # A* explores the whole space, so it must find the global optimum
+        grid = it.product(*modified_param_ranges.values())
+        configs = [dict(zip(modified_param_ranges.keys(), values)) for values in grid]
+        self.assertEqual(len(search_state.stats), len(configs))
+        self.assertEqual(s.fitness_vals[0], min(search_state.eval_fitness(c) for c in configs))
+
+    @log_name
+    def test_exhaustive(self):
+        """
+        The sweep finds the global optimum, in chunks, with or without
+        vectorized simulators
+        """
+        C = { "Area (mm2)": "(-inf, 1.6e7]" }
+        param_ranges = {
+                       "cpu_count" : list(range(1, 9)),
+                       "cpu_frequency" : list(map(lambda x: x * 10**9, range(1, 8))),
+                       "cache_size" : list(map(lambda x: 2**x, range(10, 17))),
+                       }
+        grid = it.product(*param_ranges.values())
+        configs = [dict(zip(param_ranges.keys(), values)) for values in grid]
+        expected = EmbeddedSearchState(C, {}, default_benchmark, default_options)
+        best = min(configs, key = expected.eval_fitness)
+
+        for vectorized in [True, False]:
+            s = DSE_searcher(param_ranges)
+            s.algorithm = Search_Algorithm.Exhaustive
+            s.chunk_size = 50
+            search_state = EmbeddedSearchState(C, {}, default_benchmark, default_options)
+            search_state.sims[0].vectorized = vectorized
+            s.search(search_state)
+
+            self.assertEqual(s.sys_configs[0], best)
+            self.assertEqual(s.fitness_vals[0], expected.eval_fitness(best))
+            self.assertEqual(len(search_state.stats), 1 if vectorized else len(configs))
+
+    @log_name
+    def test_bayesian(self):
+        """
+        The surrogate search gets close to the global optimum with a fraction
+        of the configs simulated, and respects the constraints
+        """
+        C = { "Area (mm2)": "(-inf, 1.6e7]" }
+        grid = it.product(*default_param_ranges.values())
+        configs = [dict(zip(default_param_ranges.keys(), values)) for values in grid]
+        expected = EmbeddedSearchState(C, {}, default_benchmark, default_options)
+        ranked = sorted(expected.eval_fitness(c) for c in configs)
+
+        r.seed(1)
+        s = DSE_searcher({}, max_iterations = 10, num_search_parties = 2)
+        s.algorithm = Search_Algorithm.Bayesian
+        search_state = EmbeddedSearchState(C, {}, default_benchmark, default_options)
+        s.search(search_state)
+
+        self.assertLessEqual(len(search_state.stats), 4 + 2 * 10)
+        self.assertLess(ranked.index(s.fitness_vals[0]), len(configs) // 20)
+        self.assertEqual(s.fitness_vals, sorted(s.fitness_vals))
+        self.assertTrue(all(C_range.in_range(search_state.merged_stats(s.sys_configs[0])[name])
+                            for (name, C_range) in search_state.constraints.items()))
+
+    @log_name
+    def test_successive_halving(self):
+        """
+        Every config is screened with the cheapest options, and only the best
+        third of them are promoted to each of the next options
+        """
+        r.seed(1)
+        s = DSE_searcher({}, num_search_parties = 2)
+        s.algorithm = Search_Algorithm.Successive_Halving
+        s.fidelities = ["10", "100", "1000"]
+        search_state = EmbeddedSearchState({}, {}, default_benchmark, "10")
+        s.search(search_state)
+
+        screened = search_state.fidelities["10"][0]
+        self.assertEqual(search_state.options, "1000")
+        self.assertLessEqual(len(screened), 2 * 3**2)
+        self.assertEqual(len(search_state.fidelities["100"][0]), math.ceil(len(screened) / 3))
+        self.assertEqual(len(search_state.stats), 2)
+
+        search_state.set_options("10")
+        best = min(search_state.eval_fitness(dict(key)) for key in screened.keys())
+        self.assertEqual(s.fitness_vals[0], best)
+        self.assertEqual(s.fitness_vals, sorted(s.fitness_vals))
+
+        r.seed(1)
+        s.algorithm = Search_Algorithm.Hyperband
+        search_state = EmbeddedSearchState({}, {}, default_benchmark, "10")
+        s.search(search_state)
+        self.assertEqual(search_state.options, "1000")
+        self.assertLessEqual(s.fitness_vals[0], best)
+        self.assertGreater(len(search_state.stats), 2)
+
+    @log_name
+    def test_nsga2(self):
+        """
+        The multi-objective search finds the Pareto front of the whole space
+        with a fraction of it simulated, and the front holds the best config
+        of every fitness profile weighing the same stats
+        """
+        grid = it.product(*default_param_ranges.values())
+        configs = [dict(zip(default_param_ranges.keys(), values)) for values in grid]
+        full = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+        for c in configs:
+            full.eval_fitness(c)
+        front = sorted(dict_to_key(c) for c in full.pareto_front())
+
+        r.seed(1)
+        s = DSE_searcher({}, max_iterations = 10, num_search_parties = 2)
+        s.algorithm = Search_Algorithm.NSGA_II
+        s.population_size = 16
+        search_state = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+        s.search(search_state)
+
+        self.assertLess(len(search_state.stats), len(configs) // 2)
+        self.assertEqual(sorted(dict_to_key(c) for c in s.pareto_front), front)
+        self.assertEqual(s.fitness_vals[0], min(full.eval_fitness(c) for c in configs))
+
+        for fitness_func in [eval_balanced, eval_high_performance]:
+            fitnesses = full.rescore(fitness_func)
+            self.assertIn(min(fitnesses, key = fitnesses.get), front)
+
+        output = json.loads(search_state.generate_job_output(s.sys_configs, s.pareto_front))
+        self.assertEqual(len(output["pareto_front"]), len(front))
+        self.assertEqual(output["objectives"], eval_embedded.features)
+
+    @log_name
+    def test_stochastic_hill_climber(self):
+        """
+        Each step only evaluates the neighbors along search_directions
+        dimensions, and only ever moves to a better config
+        """
+        start = [{"cache_size": 2**16, "cpu_frequency" : 1e9, "cpu_count" : 1}]
+
+        r.seed(1)
+        s = DSE_searcher({}, max_iterations = 30)
+        s.algorithm = Search_Algorithm.Stochastic_Hill_Climber
+        s.search_directions = 1
+        s.sys_configs = copy.deepcopy(start)
+        search_state = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+        start_fitness = search_state.eval_fitness(start[0])
+        s.search(search_state)
+
+        self.assertLess(s.fitness_vals[0], start_fitness)
+        self.assertEqual(search_state.eval_fitness(s.sys_configs[0]), s.fitness_vals[0])
+        self.assertLessEqual(search_state.simulations, 1 + 2 * 30)
+
+        for index in [(0, 0, 0), (3, 3, 3)]:
+            neighbors = s.gen_search_neighbors(index)
+            self.assertEqual(len(set(d for n in neighbors for d in range(3) if n[d] != index[d])), 1)
+
+        s.search_directions = 0
+        with self.assertRaises(ValueError):
+            s.gen_search_neighbors((0, 0, 0))
+
+    @log_name
+    def test_previous_excluded(self):
+        """
+        The climber leaves out the config it came from, even after steps on
+        which it stayed put
+        """
+        r.seed(1)
+        s = DSE_searcher({}, max_iterations = 30)
+        s.algorithm = Search_Algorithm.Stochastic_Hill_Climber
+        s.search_directions = 1
+        s.sys_configs = [{"cache_size": 2**16, "cpu_frequency" : 1e9, "cpu_count" : 1}]
+
+        steps = []
+        search_neighbors = s.search_neighbors
+        def spy(index, *args):
+            steps.append((index, args[-1][0]))
+            return search_neighbors(index, *args)
+        s.search_neighbors = spy
+        s.search(EmbeddedSearchState({}, {}, default_benchmark, default_options))
+
+        visited = [steps[0][0]]
+        for (index, _) in steps[1:]:
+            if (index != visited[-1]):
+                visited.append(index)
+        self.assertGreater(len(visited), 2)
+        self.assertLess(len(visited), len(steps))
+        for (index, excluded) in steps:
+            i = visited.index(index)
+            self.assertEqual(excluded, visited[i - 1] if i > 0 else None)
+
+    @log_name
+    def test_simulated_annealing(self):
+        grid = it.product(*default_param_ranges.values())
+        configs = [dict(zip(default_param_ranges.keys(), values)) for values in grid]
+        expected = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+        ranked = sorted(expected.eval_fitness(c) for c in configs)
+
+        r.seed(1)
+        s = DSE_searcher({}, max_iterations = 200, num_search_parties = 2)
+        s.algorithm = Search_Algorithm.Simulated_Annealing
+        search_state = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+        s.search(search_state)
+
+        self.assertLess(ranked.index(s.fitness_vals[0]), len(configs) // 20)
+        for sys_config, fitness in zip(s.sys_configs, s.fitness_vals):
+            self.assertEqual(search_state.eval_fitness(sys_config), fitness)
+
+    @log_name
+    def test_budget(self):
+        """
+        The search stops once the budget of simulations or time is spent,
+        well before max_iterations
+        """
+        # The hill climber overshoots by at most one party's step of
+        # neighbors, simulated annealing by one proposal per party
+        step_sizes = {Search_Algorithm.Elitist_Hill_Climber: 2 * len(default_param_ranges),
+                      Search_Algorithm.Simulated_Annealing: 4}
+        for algorithm, step_size in step_sizes.items():
+            s = DSE_searcher({}, max_iterations = 1000, num_search_parties = 4)
+            s.algorithm = algorithm
+            s.max_simulations = 10
+            search_state = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+            s.search(search_state)
+            self.assertGreaterEqual(search_state.simulations, 10)
+            self.assertLess(search_state.simulations, 10 + step_size)
+
+        # Every step takes at least 10ms, so at most 20 fit in the time limit
+        s = DSE_searcher({}, max_iterations = 10**6)
+        s.algorithm = Search_Algorithm.Simulated_Annealing
+        s.time_limit = 0.2
+        search_state = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+
+        steps = []
+        eval_indices = s.eval_indices
+        def slow_step(indices, search_state):
+            steps.append(indices)
+            time.sleep(0.01)
+            return eval_indices(indices, search_state)
+        s.eval_indices = slow_step
+        s.search(search_state)
+        self.assertGreaterEqual(len(steps), 1)
+        self.assertLessEqual(len(steps), 21)
+
+    @log_name
+    def test_tabu(self):
+        """
+        Tabu search walks across a plateau where the hill climber stops, and
+        never scores the same config twice
+        """
+        @uses_stats("Area (mm2)")
+        def plateau(stats):
+            return -1.0 if stats["Area (mm2)"] < 2**26 else 0.0
+
+        start = [{"cache_size": 2**16, "cpu_frequency" : 4e9, "cpu_count" : 4}]
+        for (algorithm, seed) in [(Search_Algorithm.Elitist_Hill_Climber, 0)] + \
+                                 [(Search_Algorithm.Tabu, seed) for seed in range(10)]:
+            r.seed(seed)
+            s = DSE_searcher({}, max_iterations = 200)
+            s.algorithm = algorithm
+            s.sys_configs = copy.deepcopy(start)
+            search_state = MockSearchState({}, {}, default_benchmark, default_options, plateau)
+
+            calls = []
+            eval_fitness = search_state.eval_fitness
+            search_state.eval_fitness = lambda c: calls.append(c) or eval_fitness(c)
+            s.search(search_state)
+
+            if (algorithm == Search_Algorithm.Elitist_Hill_Climber):
+                self.assertEqual((len(calls), len(search_state.stats)), (6, 6))
+                self.assertEqual(s.fitness_vals[0], 0.0)
+            else:
+                self.assertEqual(len(calls), len(search_state.stats))
+                self.assertEqual(s.fitness_vals[0], -1.0)
+
+        s = DSE_searcher({}, max_iterations = 50, num_search_parties = 2)
+        s.algorithm = Search_Algorithm.Tabu
+        s.tabu_tenure = 4
+        search_state = EmbeddedSearchState({}, {}, default_benchmark, default_options)
+        s.search(search_state)
+        for sys_config, fitness in zip(s.sys_configs, s.fitness_vals):
+            self.assertEqual(search_state.eval_fitness(sys_config), fitness)
+
+    @log_name
+    def test_monotonic_pruning(self):
+        """
+        With monotonicity hints on the constraints, the neighbors known to be
+        infeasible are discarded before simulating, and the search ends up
+        in the same place with fewer simulations
+        """
+        start = [{"cache_size": 2**16, "cpu_frequency" : 1e9, "cpu_count" : 1}]
+        hints = {"cache_size": "increasing", "cpu_count": "independent", "cpu_frequency": "independent"}
+        results = []
+        for constraint in [RangeString("(-inf, 1.6e7]"), RangeString("(-inf, 1.6e7]", hints)]:
+            s = DSE_searcher({}, max_iterations = 50)
+            s.sys_configs = copy.deepcopy(start)
+            search_state = EmbeddedSearchState({"Area (mm2)": constraint}, {},
+                                               default_benchmark, default_options)
+            s.search(search_state)
+            results.append((s.fitness_vals[0], search_state.simulations))
+
+        self.assertEqual(results[0][0], results[1][0])
+        self.assertLess(results[1][1], results[0][1])
+
+        neighbors = s.gen_neighbor_indices(s.config_to_index(start[0]), search_state)
+        self.assertEqual(neighbors, [])
+
+    @log_name
+    def test_genetic(self):
+        """
+        Each generation is evaluated as one batch, on the workers if there
+        are any, and repeated offspring are never evaluated again
+        """
+        C = { "Area (mm2)": "(-inf, 1.6e7]" }
+        grid = it.product(*default_param_ranges.values())
+        configs = [dict(zip(default_param_ranges.keys(), values)) for values in grid]
+        expected = EmbeddedSearchState(C, {}, default_benchmark, default_options)
+        ranked = sorted(expected.eval_fitness(c) for c in configs)
+
+        results = []
+        for num_workers in [1, 2]:
+            r.seed(1)
+            s = DSE_searcher({}, max_iterations = 10, num_search_parties = 2, num_workers = num_workers)
+            s.algorithm = Search_Algorithm.Genetic
+            s.population_size = 12
+            search_state = EmbeddedSearchState(C, {}, default_benchmark, default_options)
+
+            calls = []
+            eval_fitness = search_state.eval_fitness
+            search_state.eval_fitness = lambda c: calls.append(c) or eval_fitness(c)
+            s.search(search_state)
+            results.append((s.fitness_vals, s.sys_configs))
+
+            self.assertEqual(len(calls), search_state.simulations)
+            self.assertLess(search_state.simulations, 12 * 11)
+
+        self.assertEqual(results[0], results[1])
+        self.assertLess(ranked.index(results[0][0][0]), len(configs) // 20)
+        self.assertEqual(results[0][0], sorted(results[0][0]))
+
+    @log_name
+    def test_index_encoding(self):
+        s = DSE_searcher({})
+        sys_config = {"cache_size": 2**12, "cpu_frequency" : 3e9, "cpu_count" : 8}
+        index = s.config_to_index(sys_config)
+        self.assertEqual(index, (7, 2, 1))
+        self.assertEqual(s.index_to_config(index), sys_config)
+
+        neighbors = s.gen_neighbor_indices(index)
+        self.assertEqual(sorted(neighbors), sorted([(6, 2, 1), (7, 3, 1), (7, 1, 1), (7, 2, 2), (7, 2, 0)]))
+
+        neighbors = s.gen_neighbors(sys_config)
+        self.assertEqual(len(neighbors), 5)
+        self.assertTrue({"cache_size": 2**13, "cpu_frequency" : 3e9, "cpu_count" : 8} in neighbors)
+
+        with self.assertRaises(ValueError):
+            s.config_to_index({"cache_size": 1000, "cpu_frequency" : 3e9, "cpu_count" : 8})
 
     def test_embedded_heuristic(self):
         s = DSE_searcher({})
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 
+import asyncio
+import os
+import shutil
+import tempfile
 import unittest
 import defs
 
 from mock_sim import MockSim
-from mcpat_sim import McPatSim
-from gem5_sim import Gem5Sim
+from simulation_wrapper import Cleanup, SimulationError
+from mcpat_sim import McPatSim, parse_csv
+from gem5_sim import Gem5Sim, StatsTail, parse_stats, nest_stats
 
 
 default_benchmark = defs.ROOT_DIR + "/Tests/test-progs/random_access/random_access"
@@ -25,6 +30,63 @@ class TestMockSim(unittest.TestCase):
         with self.assertRaises(ValueError):
             MockSim({"fake_arg": 100})
 
+    def test_scratch_dir(self):
+        """
+        Each run gets its own directory, removed according to the cleanup
+        policy
+        """
+        sim = MockSim({})
+        sim.scratch_root = tempfile.mkdtemp()
+
+        with sim.scratch_dir() as first, sim.scratch_dir() as second:
+            self.assertNotEqual(first, second)
+            self.assertTrue(os.path.isdir(first))
+        self.assertFalse(os.path.exists(first))
+
+        for (cleanup, kept_on_success, kept_on_failure) in [(Cleanup.Always, False, False),
+                                                           (Cleanup.Keep_On_Failure, False, True),
+                                                           (Cleanup.Never, True, True)]:
+            sim.cleanup = cleanup
+            with sim.scratch_dir() as run_dir:
+                pass
+            self.assertEqual(os.path.exists(run_dir), kept_on_success)
+
+            with self.assertRaises(ValueError):
+                with sim.scratch_dir() as run_dir:
+                    raise ValueError()
+            self.assertEqual(os.path.exists(run_dir), kept_on_failure)
+
+        shutil.rmtree(sim.scratch_root)
+
+    def test_run_limits(self):
+        """
+        Programs that fail, hang or use too much memory raise SimulationError
+        """
+        sim = MockSim({})
+        run_dir = tempfile.mkdtemp()
+        log = run_dir + "/run.log"
+
+        self.assertTrue(sim.run_command(["true"], run_dir, log))
+        with self.assertRaises(SimulationError):
+            sim.run_command(["false"], run_dir, log)
+
+        sim.timeout = 0.2
+        with self.assertRaisesRegex(SimulationError, "timed out"):
+            sim.run_command(["sleep", "10"], run_dir, log)
+
+        # Address space reserved but never touched doesn't count, like
+        # gem5's, only resident memory
+        sim.timeout = 10
+        sim.poll_interval = 0.05
+        sim.max_memory = 2**28
+        self.assertTrue(sim.run_command(["python3", "-c", "import mmap; mmap.mmap(-1, 2**30)"], run_dir, log))
+        with self.assertRaisesRegex(SimulationError, "memory"):
+            sim.run_command(["python3", "-c", "import time; x = b'x' * 2**29; time.sleep(10)"], run_dir, log)
+        with self.assertRaisesRegex(SimulationError, "memory"):
+            asyncio.run(sim.run_command_async(["python3", "-c", "import time; x = b'x' * 2**29; time.sleep(10)"],
+                                              run_dir, log))
+        shutil.rmtree(run_dir)
+
     def test_different_args_different_results(self):
         """
         Different cache sizes should give different results
@@ -36,6 +98,26 @@ class TestMockSim(unittest.TestCase):
         sim_large.run()
         self.assertNotEqual(sim_small.stats, sim_large.stats)
 
+    def test_batch_stats(self):
+        """
+        Stats computed in a batch match those of single runs
+        """
+        import numpy as np
+
+        configs = [{"cache_size" : 2**i, "cpu_count" : i % 4 + 1} for i in range(10, 17)]
+        sim = MockSim({})
+        stats = sim.batch_stats({"cache_size" : np.array([c["cache_size"] for c in configs]),
+                                 "cpu_count" : np.array([c["cpu_count"] for c in configs])})
+
+        for (i, config) in enumerate(configs):
+            single = MockSim(config)
+            single.run()
+            for name in single.stats.keys():
+                self.assertAlmostEqual(stats[name][i], single.stats[name])
+
+        with self.assertRaises(ValueError):
+            sim.batch_stats({"fake_arg": np.array([1])})
+
 class TestMcPatSim(unittest.TestCase):
     def test_valid_args(self):
         """
@@ -85,6 +167,131 @@ class TestMcPatSim(unittest.TestCase):
         sim_large.run()
         self.assertNotEqual(sim_small.stats, sim_large.stats)
 
+sample_stats = """
+---------- Begin Simulation Statistics ----------
+sim_seconds                                  0.000219                       # Number of seconds simulated
+sim_ticks                                   219000000                       # Number of ticks simulated
+system.voltage_domain.voltage                       1                       # Voltage in Volts
+system.cpu.ipc                                    nan                       # IPC: Instructions Per Cycle
+system.cpu.op_class::IntAlu                      3789     64.98%     64.98% # Class of executed instruction
+system.cpu.op_class::total                       5831                       # Class of executed instruction
+system.cpu.commit.committed_per_cycle::0-1         12     50.00%     50.00% # Number of insts commited each cycle
+system.ruby.latency_hist::samples                   6                       # delay histogram for all message
+system.ruby.latency_hist                 |           1 16.67% 16.67% |           5 83.33% 100.00% # delay histogram for all message
+system.cpu.status                            no_value                       # Not a number
+system.cpu.status.detail                            1                       # Stat under a stat
+
+---------- End Simulation Statistics   ----------
+"""
+
+class TestStatsParser(unittest.TestCase):
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile("w", suffix = ".txt", delete = False)
+        f.write(sample_stats)
+        f.close()
+        self.filename = f.name
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_flat_stats(self):
+        stats = parse_stats(self.filename)
+        self.assertEqual(stats["sim_seconds"], 0.000219)
+        self.assertEqual(stats["sim_ticks"], 219000000)
+        self.assertEqual(stats["system.voltage_domain.voltage"], 1)
+        self.assertTrue(stats["system.cpu.ipc"] != stats["system.cpu.ipc"])
+        self.assertEqual(stats["system.cpu.op_class::IntAlu"], 3789)
+        self.assertEqual(stats["system.cpu.commit.committed_per_cycle::0-1"], 12)
+        self.assertEqual(stats["system.ruby.latency_hist::buckets"], [1, 5])
+        self.assertEqual(stats["system.cpu.status"], "no_value")
+        self.assertEqual(len(stats), 11)
+
+    def test_nested_stats(self):
+        stats = nest_stats(parse_stats(self.filename))
+        self.assertEqual(stats["sim_seconds"], 0.000219)
+        self.assertEqual(stats["system"]["voltage_domain"]["voltage"], 1)
+        self.assertEqual(stats["system"]["cpu"]["op_class"], {"IntAlu": 3789, "total": 5831})
+        self.assertEqual(stats["system"]["ruby"]["latency_hist"], {"samples": 6, "buckets": [1, 5]})
+        self.assertEqual(stats["system"]["cpu"]["status"], "no_value")
+        self.assertEqual(stats["system"]["cpu"]["status.detail"], 1)
+
+    def test_nested_stats_order(self):
+        """
+        A name that is both a stat and a domain nests the same way whatever
+        order the stats come in, and no stat is lost
+        """
+        expected = {"a": {"b": 2, "b.c": 1, "b.d.e": 3, "b.op.x": 4}}
+        flat = [("a.b.c", 1), ("a.b.d.e", 3), ("a.b.op::x", 4), ("a.b", 2)]
+        self.assertEqual(nest_stats(dict(flat)), expected)
+        self.assertEqual(nest_stats(dict(reversed(flat))), expected)
+
+        self.assertEqual(nest_stats({"a.b.c": 1, "a.b": 2}), {"a": {"b": 2, "b.c": 1}})
+        self.assertEqual(nest_stats({"a.b": 2, "a.b.c": 1}), {"a": {"b": 2, "b.c": 1}})
+
+    def test_filtered_stats(self):
+        stats = parse_stats(self.filename, set(["sim_seconds", "system.cpu.op_class",
+                                                "system.ruby.latency_hist"]))
+        self.assertEqual(stats, {"sim_seconds": 0.000219,
+                                 "system.cpu.op_class::IntAlu": 3789,
+                                 "system.cpu.op_class::total": 5831,
+                                 "system.ruby.latency_hist::samples": 6,
+                                 "system.ruby.latency_hist::buckets": [1, 5]})
+
+    def test_empty_file(self):
+        open(self.filename, "w").close()
+        self.assertEqual(parse_stats(self.filename), {})
+
+    def test_periodic_dumps(self):
+        """
+        Dumps are read as they are completed, and the last complete dump is
+        the one parsed
+        """
+        tail = StatsTail(self.filename, set(["sim_seconds"]))
+        self.assertEqual(tail.read_dumps(), [{"sim_seconds": 0.000219}])
+        self.assertEqual(tail.read_dumps(), [])
+
+        second_dump = sample_stats.replace("0.000219", "0.000438")
+        with open(self.filename, "a") as f:
+            f.write(second_dump[:len(second_dump) // 2])
+        self.assertEqual(tail.read_dumps(), [])
+        self.assertEqual(parse_stats(self.filename, set(["sim_seconds"])), {"sim_seconds": 0.000219})
+
+        with open(self.filename, "a") as f:
+            f.write(second_dump[len(second_dump) // 2:])
+        self.assertEqual(tail.read_dumps(), [{"sim_seconds": 0.000438}])
+        self.assertEqual(parse_stats(self.filename, set(["sim_seconds"])), {"sim_seconds": 0.000438})
+
+sample_csv = """Tech node (nm), Capacity (bytes), Dynamic search energy (nJ), Dynamic read energy (nJ), Area (mm2), 
+22, 1024, N/A, 0.0108, 0.0285, 
+22, 2048, N/A, 0.0118, 0.0401, 
+"""
+
+class TestCsvParser(unittest.TestCase):
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile("w", suffix = ".csv", delete = False)
+        f.write(sample_csv)
+        f.close()
+        self.filename = f.name
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_last_row(self):
+        stats = parse_csv(self.filename)
+        self.assertEqual(stats["Capacity (bytes)"], 2048.0)
+        self.assertEqual(stats["Area (mm2)"], 0.0401)
+        self.assertTrue(stats["Dynamic search energy (nJ)"] != stats["Dynamic search energy (nJ)"])
+        self.assertEqual(len(stats), 5)
+
+    def test_fields(self):
+        stats = parse_csv(self.filename, ["Area (mm2)", "Dynamic read energy (nJ)"])
+        self.assertEqual(stats, {"Area (mm2)": 0.0401, "Dynamic read energy (nJ)": 0.0118})
+
+    def test_no_rows(self):
+        with open(self.filename, "w") as f:
+            f.write(sample_csv.splitlines()[0] + "\n")
+        self.assertEqual(parse_csv(self.filename), {})
+
 class TestGem5Sim(unittest.TestCase):
     def test_sim_stats(self):
         sim = Gem5Sim(default_benchmark, default_options)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import datetime
+import logging
+import unittest
+import os
+import defs
+
+import numpy as np
+
+from range_string import RangeString
+from surrogate import GaussianProcess, expected_improvement, probability_in_range, select_batch
+from test_utils import log_name
+
+class TestSurrogate(unittest.TestCase):
+    @log_name
+    def test_gaussian_process(self):
+        """
+        The model interpolates the points it was fitted to, and is unsure
+        far away from them
+        """
+        X = np.linspace(0, 1, 8)[:, None]
+        y = np.sin(6 * X[:, 0]) * 100
+        gp = GaussianProcess().fit(X, y)
+
+        (mean, std) = gp.predict(X)
+        self.assertTrue(np.allclose(mean, y, atol = 1e-2))
+        self.assertTrue(np.all(std < 1))
+
+        (mean, far_std) = gp.predict(np.array([[3.0]]))
+        self.assertGreater(far_std[0], 10)
+
+    @log_name
+    def test_acquisition(self):
+        mean = np.array([1.0, 0.0, 0.0])
+        std = np.array([0.1, 0.1, 1.0])
+        ei = expected_improvement(mean, std, 0.5)
+        self.assertLess(ei[0], ei[1])
+        self.assertLess(ei[1], ei[2])
+
+        p = probability_in_range(np.array([0.0, 5.0]), np.array([1.0, 1.0]), RangeString("(-inf, 0]"))
+        self.assertAlmostEqual(p[0], 0.5)
+        self.assertLess(p[1], 1e-6)
+
+    @log_name
+    def test_select_batch(self):
+        """
+        A batch doesn't pile up on neighbouring points of the same peak
+        """
+        candidates = np.array([[0.0], [0.01], [0.5], [1.0]])
+        acquisition = np.array([1.0, 0.99, 0.5, 0.1])
+        self.assertEqual(select_batch(acquisition, candidates, 2), [0, 2])
+        self.assertEqual(sorted(select_batch(acquisition, candidates, 10)), [0, 1, 2, 3])
+
+if __name__ == '__main__':
+    script_name = os.path.basename(__file__)
+    script_name = script_name.split(".")[0]
+    logging.basicConfig(filename = defs.LOG_DIR + '/{}.log'.format(script_name),  level = logging.INFO)
+    logging.info("START {} TESTS: {:%Y-%m-%d %H:%M:%S}".format(script_name, datetime.datetime.now()))
+    unittest.main()
+    logging.info("END {} TESTS".format(script_name))
@@ -1,14 +1,13 @@
 import csv
+from collections import deque
 
-with open('out.csv', 'r') as csvfile:
+with open('out.csv', 'r', newline='') as csvfile:
     mcpat_data = csv.reader(csvfile, delimiter=',')
     names = next(mcpat_data)
+    # Each run appends a row, only the last one is kept
+    last = deque(mcpat_data, maxlen=1)
     # Strip out whitespace and null ending entry
-    names = list(filter(lambda x: x, map(lambda x: x.strip(), names)))
-    data = dict((name, []) for name in names)
-    for line in mcpat_data:
-        for (name, entry) in zip(names, line):
-            data[name].append(entry)
+    data = dict((name.strip(), float("nan") if entry.strip() == "N/A" else float(entry))
+                for (name, entry) in zip(names, last[0]) if name.strip())
     for key in ["Area (mm2)", "Dynamic read energy (nJ)", "Dynamic write energy (nJ)"]:
         print("{0}: {1}".format(key, str(data[key])))
-
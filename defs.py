@@ -2,5 +2,8 @@ import os
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_DIR = ROOT_DIR + "/_TestOut"
+# Each simulation run gets its own directory under SCRATCH_DIR (e.g. a tmpfs
+# mount), or under tempfile.gettempdir() if it is None
+SCRATCH_DIR = None
 GEM5_DIR = ROOT_DIR + "/gem5"
 BENCHMARK_PATH = ROOT_DIR + "/Tests/test-progs/random_access/random_access --options=100"
@@ -20,6 +20,14 @@ fi
 
 ./Tests/test_range_string.py
 
+./Tests/test_result_store.py
+
+./Tests/test_fitness_engine.py
+
+./Tests/test_surrogate.py
+
+./Tests/test_pareto.py
+
 # TODO:  Remove these tests when they are all replaced by unit tests
 test_script SimulationWrappers/simulation_wrapper.py
 test_script validate_json.py